@@ -0,0 +1,67 @@
+'''Compares decoding time with full and windowed attention on long inputs.
+
+Usage (from the repository root):
+  python3 -m bench.attention_window --checkpoint=~/tacotron/logs-tacotron/model.ckpt-185000 \\
+    --text_file=long_sentences.txt --windows=0,16,32
+
+The text file has one sentence per line, in the format accepted by Synthesizer.synthesize. Without
+it, random symbol sequences of --lengths are used. Without --checkpoint the model is randomly
+initialized: timings are still meaningful, but decoding always runs for max_iters steps.
+'''
+import argparse
+import numpy as np
+import os
+from bench.common import decode, load_model, random_sentences
+from hparams import hparams
+from text import text_to_sequence_zh
+
+
+def get_sequences(args):
+  if args.text_file:
+    with open(args.text_file, encoding='utf-8') as f:
+      return [text_to_sequence_zh(line.strip(), []) for line in f if line.strip()]
+  lengths = [int(x) for x in args.lengths.split(',')]
+  return [text_to_sequence_zh(text, []) for text in random_sentences(lengths, args.seed)]
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--checkpoint', help='Path to model checkpoint')
+  parser.add_argument('--text_file', help='File with one sentence per line')
+  parser.add_argument('--lengths', default='50,100,200,400',
+    help='Input lengths of random sequences, if no text_file is given')
+  parser.add_argument('--windows', default='0,16,32',
+    help='Comma-separated attention_window values. 0 is full attention.')
+  parser.add_argument('--repeat', type=int, default=3, help='Runs per sentence (best is reported)')
+  parser.add_argument('--seed', type=int, default=1234)
+  parser.add_argument('--hparams', default='',
+    help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  args = parser.parse_args()
+  os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+  hparams.parse(args.hparams)
+  if args.checkpoint:
+    args.checkpoint = os.path.expanduser(args.checkpoint)
+
+  sequences = get_sequences(args)
+  windows = [int(x) for x in args.windows.split(',')]
+  results = {}
+  for window in windows:
+    model, session = load_model(args.checkpoint, 'attention_window=%d' % window)
+    results[window] = [decode(model, session, seq, args.repeat) for seq in sequences]
+    session.close()
+
+  # Mel L1 is measured against the first window setting (full attention by default):
+  print('T_in  window  steps  wall_sec  ms/step  mel_l1')
+  for i, seq in enumerate(sequences):
+    reference = results[windows[0]][i][0]
+    for window in windows:
+      mel, wall = results[window][i]
+      steps = len(mel) // hparams.outputs_per_step
+      n = min(len(mel), len(reference))
+      l1 = np.mean(np.abs(mel[:n] - reference[:n])) if n > 0 else float('nan')
+      print('%4d  %6d  %5d  %8.3f  %7.2f  %6.4f' % (
+        len(seq), window, steps, wall, 1000 * wall / max(1, steps), l1))
+
+
+if __name__ == '__main__':
+  main()
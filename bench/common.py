@@ -0,0 +1,82 @@
+import numpy as np
+import resource
+import tensorflow as tf
+import time
+from hparams import hparams
+from models import create_model
+from text.symbols import pinyin_symbols
+
+
+def load_model(checkpoint, overrides=''):
+  '''Builds the inference model in its own graph after applying hparams overrides.
+
+  Returns the model and a session with the checkpoint restored (or randomly initialized
+  variables if checkpoint is None).
+  '''
+  hparams.parse(overrides)
+  with tf.Graph().as_default():
+    inputs = tf.placeholder(tf.int32, [None, None], 'inputs')
+    input_lengths = tf.placeholder(tf.int32, [None], 'input_lengths')
+    with tf.variable_scope('model') as scope:
+      model = create_model('tacotron', hparams)
+      model.initialize(inputs, input_lengths)
+    session = tf.Session()
+    session.run(tf.global_variables_initializer())
+    if checkpoint:
+      tf.train.Saver().restore(session, checkpoint)
+  return model, session
+
+
+def decode(model, session, seq, repeat=1):
+  '''Returns the mel outputs for seq and the best wall time over repeat runs.'''
+  feed_dict = {
+    model.inputs: [np.asarray(seq, dtype=np.int32)],
+    model.input_lengths: np.asarray([len(seq)], dtype=np.int32)
+  }
+  times = []
+  for i in range(repeat):
+    start = time.time()
+    mel = session.run(model.mel_outputs[0], feed_dict=feed_dict)
+    times.append(time.time() - start)
+  return mel, min(times)
+
+
+def random_sentences(lengths, seed=1234):
+  '''Returns random symbol sentences of the given lengths, as accepted by Synthesizer.synthesize'''
+  rng = np.random.RandomState(seed)
+  return [' '.join(rng.choice(pinyin_symbols[2:], n)) for n in lengths]
+
+
+def timeit(f, repeat):
+  '''Runs f repeat times and returns the durations in seconds'''
+  durations = []
+  for i in range(repeat):
+    start = time.time()
+    f()
+    durations.append(time.time() - start)
+  return durations
+
+
+def summarize(durations, audio_seconds=None):
+  '''Returns latency percentiles (sec), and the real-time factor if audio_seconds is given.
+
+  audio_seconds is the audio produced by each run (a list, or a number for all runs). The
+  real-time factor is total time / total audio.
+  '''
+  result = {
+    'runs': len(durations),
+    'mean': float(np.mean(durations)),
+    'p50': float(np.percentile(durations, 50)),
+    'p90': float(np.percentile(durations, 90)),
+    'p99': float(np.percentile(durations, 99)),
+  }
+  if audio_seconds is not None:
+    audio_seconds = np.broadcast_to(audio_seconds, len(durations))
+    result['audio_seconds'] = float(np.sum(audio_seconds))
+    result['rtf'] = float(np.sum(durations) / max(np.sum(audio_seconds), 1e-9))
+  return result
+
+
+def peak_rss_mb():
+  '''Peak resident set size of this process so far (ru_maxrss is in KB on Linux)'''
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
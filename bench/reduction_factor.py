@@ -0,0 +1,61 @@
+'''Compares decoding speed and quality for different reduction factors (outputs_per_step).
+
+Decodes --num examples of the training data with each r and reports decoder steps, wall time and
+the mel L1 distance to the ground truth (over the shorter of the two lengths). The checkpoint must
+have been trained with max_outputs_per_step at least as large as the largest r, e.g. with
+--hparams="max_outputs_per_step=7,outputs_per_step_schedule=0:7,20000:5,60000:3,100000:2".
+
+Usage (from the repository root):
+  python3 -m bench.reduction_factor --checkpoint=~/tacotron/logs-tacotron/model.ckpt-185000 \\
+    --hparams="max_outputs_per_step=7" --r=2,3,5,7
+'''
+import argparse
+import numpy as np
+import os
+from bench.common import decode, load_model
+from hparams import hparams
+from text import text_to_sequence
+
+
+def load_examples(metadata_filename, num):
+  '''Returns (sequence, mel_target) for the first num examples of the metadata file.'''
+  datadir = os.path.dirname(metadata_filename)
+  cleaner_names = [x.strip() for x in hparams.cleaners.split(',')]
+  with open(metadata_filename, encoding='utf-8') as f:
+    metadata = [line.strip().split('|') for line in f][:num]
+  return [(text_to_sequence(meta[3], cleaner_names, lang='zh'),
+    np.load(os.path.join(datadir, meta[1]))) for meta in metadata]
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--checkpoint', required=True, help='Path to model checkpoint')
+  parser.add_argument('--base_dir', default=os.path.expanduser('~/tacotron'))
+  parser.add_argument('--input', default='training/train.txt')
+  parser.add_argument('--num', type=int, default=10, help='Number of examples to decode')
+  parser.add_argument('--r', default='2,3,5,7', help='Comma-separated reduction factors')
+  parser.add_argument('--repeat', type=int, default=1, help='Runs per example (best is reported)')
+  parser.add_argument('--hparams', default='',
+    help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  args = parser.parse_args()
+  os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+  hparams.parse(args.hparams)
+
+  examples = load_examples(os.path.join(args.base_dir, args.input), args.num)
+  print('   r  decoder_steps  wall_sec  ms/step  mel_l1')
+  for r in [int(x) for x in args.r.split(',')]:
+    model, session = load_model(os.path.expanduser(args.checkpoint), 'outputs_per_step=%d' % r)
+    steps, wall, l1 = [], [], []
+    for seq, target in examples:
+      mel, seconds = decode(model, session, seq, args.repeat)
+      n = min(len(mel), len(target))
+      steps.append(len(mel) // r)
+      wall.append(seconds)
+      l1.append(np.mean(np.abs(mel[:n] - target[:n])))
+    session.close()
+    print('%4d  %13.1f  %8.3f  %7.2f  %6.4f' % (
+      r, np.mean(steps), np.mean(wall), 1000 * sum(wall) / max(1, sum(steps)), np.mean(l1)))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,210 @@
+'''Per-stage and end-to-end inference benchmark with JSON output.
+
+Stages: text frontend, Tacotron encoder, encoder + decoder, full Tacotron (with post-processing
+CBHG), Griffin-Lim in NumPy and TensorFlow, and end to end (Synthesizer.synthesize). Tacotron is
+also run at several batch sizes for throughput. With --vocoder, teacher (incremental) and student
+vocoding are measured by parallel_wavenet_vocoder/benchmark.py in a subprocess, since the vocoder
+has its own hparams module.
+
+Latencies are in seconds, "rtf" is total time / total seconds of audio produced, and
+peak_rss_mb is the peak RSS of the process after the stage. Without --checkpoint the model is
+randomly initialized, so decoding always runs for max_iters steps, and the end-to-end stage
+(which loads the checkpoint through Synthesizer) is skipped.
+
+Usage (from the repository root):
+  python3 -m bench.suite --checkpoint=~/tacotron/logs-tacotron/model.ckpt-185000 \\
+    --output=bench-$(git rev-parse --short HEAD).json
+'''
+import argparse
+import json
+import multiprocessing
+import numpy as np
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import tensorflow as tf
+from bench.common import load_model, peak_rss_mb, random_sentences, summarize, timeit
+from hparams import hparams
+from synthesizer import Synthesizer
+from text import text_to_sequence_zh
+from util import audio
+
+
+def frames_to_seconds(frames):
+  return frames * hparams.frame_shift_ms / 1000
+
+
+def feed(model, seqs):
+  max_len = max(len(seq) for seq in seqs)
+  return {
+    model.inputs: np.asarray([seq + [0] * (max_len - len(seq)) for seq in seqs], dtype=np.int32),
+    model.input_lengths: np.asarray([len(seq) for seq in seqs], dtype=np.int32)
+  }
+
+
+def bench_tacotron(args, sentences, results):
+  cleaner_names = [x.strip() for x in hparams.cleaners.split(',')]
+  seqs = [text_to_sequence_zh(text, cleaner_names) for text in sentences]
+  results['frontend'] = summarize(
+    timeit(lambda: [text_to_sequence_zh(text, cleaner_names) for text in sentences], args.repeat))
+  results['frontend']['peak_rss_mb'] = peak_rss_mb()
+
+  model, session = load_model(args.checkpoint)
+  for name, output in [('encoder', model.encoder_outputs),
+                       ('encoder_decoder', model.mel_outputs),
+                       ('tacotron', model.linear_outputs)]:
+    durations, audio_seconds = [], []
+    for seq in seqs:
+      session.run(output, feed_dict=feed(model, [seq]))  # warmup
+      durations.extend(timeit(lambda: session.run(output, feed_dict=feed(model, [seq])),
+        args.repeat))
+      mel = session.run(model.mel_outputs[0], feed_dict=feed(model, [seq]))
+      audio_seconds.extend([frames_to_seconds(len(mel))] * args.repeat)
+    results[name] = summarize(durations, audio_seconds)
+    results[name]['peak_rss_mb'] = peak_rss_mb()
+  linears = [session.run(model.linear_outputs[0], feed_dict=feed(model, [seq])) for seq in seqs]
+
+  throughput = []
+  for batch_size in [int(x) for x in args.batch_sizes.split(',')]:
+    batch = (seqs * batch_size)[:batch_size]
+    session.run(model.linear_outputs, feed_dict=feed(model, batch))  # warmup
+    durations = timeit(lambda: session.run(model.linear_outputs, feed_dict=feed(model, batch)),
+      args.repeat)
+    frames = session.run(tf.shape(model.linear_outputs)[1], feed_dict=feed(model, batch))
+    throughput.append({
+      'batch_size': batch_size,
+      'p50': float(np.percentile(durations, 50)),
+      'sentences_per_sec': batch_size / float(np.median(durations)),
+      'audio_seconds_per_sec': batch_size * frames_to_seconds(frames) / float(np.median(durations)),
+      'peak_rss_mb': peak_rss_mb()
+    })
+  results['tacotron_batch'] = throughput
+  session.close()
+  return linears
+
+
+def bench_griffin_lim(args, linears, results):
+  audio_seconds = [frames_to_seconds(len(linear)) for linear in linears]
+  durations = []
+  for linear in linears:
+    durations.extend(timeit(lambda: audio.inv_spectrogram(linear.T), args.repeat))
+  results['griffin_lim_numpy'] = summarize(durations, np.repeat(audio_seconds, args.repeat))
+  results['griffin_lim_numpy']['peak_rss_mb'] = peak_rss_mb()
+
+  with tf.Graph().as_default():
+    spectrogram = tf.placeholder(tf.float32, [None, hparams.num_freq])
+    wav = audio.inv_spectrogram_tensorflow(spectrogram)
+    with tf.Session() as session:
+      durations = []
+      for linear in linears:
+        session.run(wav, feed_dict={spectrogram: linear})  # warmup
+        durations.extend(timeit(lambda: session.run(wav, feed_dict={spectrogram: linear}),
+          args.repeat))
+  results['griffin_lim_tf'] = summarize(durations, np.repeat(audio_seconds, args.repeat))
+  results['griffin_lim_tf']['peak_rss_mb'] = peak_rss_mb()
+
+
+def bench_end_to_end(args, sentences, results):
+  synth = Synthesizer()
+  with tf.Graph().as_default():
+    synth.load(args.checkpoint)
+  durations, audio_seconds = [], []
+  for text in sentences:
+    wav = synth.synthesize(text)  # warmup
+    # 16-bit PCM wav, minus the 44-byte header:
+    seconds = (len(wav) - 44) / 2 / hparams.sample_rate
+    durations.extend(timeit(lambda: synth.synthesize(text), args.repeat))
+    audio_seconds.extend([seconds] * args.repeat)
+  results['end_to_end'] = summarize(durations, audio_seconds)
+  results['end_to_end']['peak_rss_mb'] = peak_rss_mb()
+  synth.session.close()
+
+
+def bench_vocoder(args, results):
+  with tempfile.NamedTemporaryFile(suffix='.json') as f:
+    command = [sys.executable, 'benchmark.py', 'vocoder', '--json=%s' % f.name,
+      '--repeat=%d' % args.repeat, '--frames=%d' % args.vocoder_frames]
+    for option in ['preset', 'hparams', 'teacher', 'student']:
+      value = getattr(args, 'vocoder_%s' % option)
+      if value:
+        command.append('--%s=%s' % (option, value))
+    subprocess.check_call(command, cwd=os.path.join(os.path.dirname(__file__), '..',
+      'parallel_wavenet_vocoder'))
+    with open(f.name) as results_file:
+      for name, result in json.load(results_file).items():
+        results['vocoder_%s' % name] = result
+
+
+def git_commit():
+  try:
+    return subprocess.check_output(['git', 'rev-parse', 'HEAD']).decode().strip()
+  except Exception:
+    return None
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--checkpoint', help='Path to Tacotron checkpoint')
+  parser.add_argument('--text_file', help='File with one sentence per line')
+  parser.add_argument('--lengths', default='10,20,40',
+    help='Input lengths of random sentences, if no text_file is given')
+  parser.add_argument('--repeat', type=int, default=5, help='Timed runs per sentence')
+  parser.add_argument('--batch_sizes', default='1,2,4,8')
+  parser.add_argument('--output', help='Write the results as JSON to this path')
+  parser.add_argument('--hparams', default='',
+    help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  parser.add_argument('--vocoder', action='store_true', help='Also benchmark the vocoder')
+  parser.add_argument('--vocoder_preset', help='Vocoder preset json (relative to parallel_wavenet_vocoder)')
+  parser.add_argument('--vocoder_hparams', default='', help='Vocoder hyperparameter overrides')
+  parser.add_argument('--vocoder_teacher', help='Teacher checkpoint (random weights if not given)')
+  parser.add_argument('--vocoder_student', help='Student checkpoint (random weights if not given)')
+  parser.add_argument('--vocoder_frames', type=int, default=200, help='Mel frames to vocode')
+  args = parser.parse_args()
+  os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+  hparams.parse(args.hparams)
+  if args.checkpoint:
+    args.checkpoint = os.path.expanduser(args.checkpoint)
+
+  if args.text_file:
+    with open(args.text_file, encoding='utf-8') as f:
+      sentences = [line.strip() for line in f if line.strip()]
+  else:
+    sentences = random_sentences([int(x) for x in args.lengths.split(',')])
+
+  stages = {}
+  linears = bench_tacotron(args, sentences, stages)
+  bench_griffin_lim(args, linears, stages)
+  if args.checkpoint:
+    bench_end_to_end(args, sentences, stages)
+  if args.vocoder:
+    bench_vocoder(args, stages)
+
+  results = {
+    'commit': git_commit(),
+    'machine': {
+      'platform': platform.platform(),
+      'processor': platform.processor(),
+      'cpu_count': multiprocessing.cpu_count(),
+      'tensorflow': tf.__version__
+    },
+    'args': vars(args),
+    'hparams': hparams.values(),
+    'stages': stages
+  }
+  for name, result in stages.items():
+    if isinstance(result, dict):
+      print('%-28s p50 %8.3f s  p90 %8.3f s  rtf %s' % (name, result['p50'], result['p90'],
+        '%.3f' % result['rtf'] if 'rtf' in result else '-'))
+  for result in stages['tacotron_batch']:
+    print('tacotron batch %-13d p50 %8.3f s  %.2f sentences/sec' % (
+      result['batch_size'], result['p50'], result['sentences_per_sec']))
+  if args.output:
+    with open(args.output, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+    print('Wrote %s' % args.output)
+
+
+if __name__ == '__main__':
+  main()
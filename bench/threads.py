@@ -0,0 +1,83 @@
+'''Sweeps session thread settings for Synthesizer and reports latency and throughput.
+
+For each intra_op_threads x inter_op_threads setting, synthesizes a fixed sentence set --repeat
+times from --concurrency client threads sharing one session, and reports latency p50/p95 (sec
+per sentence) and throughput (sentences/sec). The first pass over the sentences is a warmup and
+is not counted.
+
+Usage (from the repository root):
+  python3 -m bench.threads --checkpoint=~/tacotron/logs-tacotron/model.ckpt-185000 \\
+    --intra=1,2,4,8 --inter=1,2 --concurrency=1
+'''
+import argparse
+import numpy as np
+import os
+import tensorflow as tf
+import threading
+import time
+from bench.common import random_sentences
+from hparams import hparams
+from synthesizer import Synthesizer, session_config
+
+
+def run(synth, sentences, repeat, concurrency):
+  '''Returns per-sentence latencies and the total wall time.'''
+  latencies = []
+  lock = threading.Lock()
+  def client(index):
+    for i, text in enumerate(sentences * repeat):
+      if i % concurrency != index:
+        continue
+      start = time.time()
+      synth.synthesize(text)
+      with lock:
+        latencies.append(time.time() - start)
+  threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+  start = time.time()
+  for t in threads:
+    t.start()
+  for t in threads:
+    t.join()
+  return latencies, time.time() - start
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--checkpoint', required=True, help='Path to model checkpoint')
+  parser.add_argument('--text_file', help='File with one sentence per line')
+  parser.add_argument('--lengths', default='10,20,40,80',
+    help='Input lengths of random sentences, if no text_file is given')
+  parser.add_argument('--intra', default='1,2,4,0', help='intra_op_threads values (0: default)')
+  parser.add_argument('--inter', default='1,2,0', help='inter_op_threads values (0: default)')
+  parser.add_argument('--graph_opt_level', type=int, default=1, choices=[0, 1])
+  parser.add_argument('--xla', action='store_true')
+  parser.add_argument('--repeat', type=int, default=3, help='Passes over the sentence set')
+  parser.add_argument('--concurrency', type=int, default=1, help='Concurrent client threads')
+  parser.add_argument('--hparams', default='',
+    help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  args = parser.parse_args()
+  os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+  hparams.parse(args.hparams)
+
+  if args.text_file:
+    with open(args.text_file, encoding='utf-8') as f:
+      sentences = [line.strip() for line in f if line.strip()]
+  else:
+    sentences = random_sentences([int(x) for x in args.lengths.split(',')])
+
+  print('intra  inter  p50_sec  p95_sec  sentences/sec')
+  for intra in [int(x) for x in args.intra.split(',')]:
+    for inter in [int(x) for x in args.inter.split(',')]:
+      synth = Synthesizer()
+      with tf.Graph().as_default():
+        synth.load(os.path.expanduser(args.checkpoint),
+          config=session_config(intra, inter, args.graph_opt_level, args.xla))
+      run(synth, sentences, 1, 1)
+      latencies, wall = run(synth, sentences, args.repeat, args.concurrency)
+      synth.session.close()
+      print('%5d  %5d  %7.3f  %7.3f  %13.2f' % (intra, inter, np.percentile(latencies, 50),
+        np.percentile(latencies, 95), len(latencies) / wall))
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,91 @@
+'''Measures Tacotron training throughput with 1, 2 and 4 synchronous workers on one machine.
+
+For each worker count N, starts a parameter server and N workers of train.py on localhost, each
+with (number of cores / N) intra-op threads, and reports examples/sec from the chief's step log
+(counted with batch_size, so leave batch_frames unset).
+
+Usage (from the repository root):
+  python3 -m bench.train_scaling --base_dir=~/tacotron --workers=1,2,4 --steps=50
+'''
+import argparse
+import multiprocessing
+import os
+import re
+import socket
+import subprocess
+import sys
+import time
+from hparams import hparams
+
+
+def free_ports(count):
+  sockets = [socket.socket() for i in range(count)]
+  for s in sockets:
+    s.bind(('localhost', 0))
+  ports = [s.getsockname()[1] for s in sockets]
+  for s in sockets:
+    s.close()
+  return ports
+
+
+def run(num_workers, args):
+  '''Trains for warmup + steps global steps with num_workers workers. Returns sec/step.'''
+  ports = free_ports(num_workers + 1)
+  command = [sys.executable, 'train.py',
+    '--base_dir=%s' % args.base_dir,
+    '--input=%s' % args.input,
+    '--hparams=%s' % args.hparams,
+    '--name=scaling-%d' % num_workers,
+    '--max_steps=%d' % (args.warmup + args.steps),
+    '--summary_interval=1000000000',
+    '--checkpoint_interval=1000000000',
+    '--intra_op_threads=%d' % max(1, multiprocessing.cpu_count() // num_workers),
+    '--ps_hosts=localhost:%d' % ports[0],
+    '--worker_hosts=%s' % ','.join('localhost:%d' % p for p in ports[1:])]
+  others = [subprocess.Popen(command + ['--job_name=ps'], stdout=subprocess.DEVNULL)]
+  others += [subprocess.Popen(command + ['--task_index=%d' % i], stdout=subprocess.DEVNULL)
+    for i in range(1, num_workers)]
+  chief = subprocess.Popen(command, stdout=subprocess.PIPE, universal_newlines=True)
+  step_times = {}
+  try:
+    for line in chief.stdout:
+      match = re.match(r'Step (\d+)', line)
+      if match:
+        step_times[int(match.group(1))] = time.time()
+    chief.wait()
+  finally:
+    # Non-chief workers block on the sync token queue once the chief stops:
+    for p in others:
+      p.kill()
+      p.wait()
+  end = args.warmup + args.steps
+  if args.warmup not in step_times or end not in step_times:
+    raise Exception('Training with %d workers did not reach step %d' % (num_workers, end))
+  return (step_times[end] - step_times[args.warmup]) / args.steps
+
+
+def main():
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--base_dir', default=os.path.expanduser('~/tacotron'))
+  parser.add_argument('--input', default='training/train.txt')
+  parser.add_argument('--hparams', default='',
+    help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  parser.add_argument('--workers', default='1,2,4', help='Comma-separated worker counts.')
+  parser.add_argument('--steps', type=int, default=50, help='Global steps to time.')
+  parser.add_argument('--warmup', type=int, default=10, help='Global steps to skip before timing.')
+  args = parser.parse_args()
+  hparams.parse(args.hparams)
+
+  # Each global step averages one batch from every worker:
+  examples_per_batch = hparams.batch_size * hparams.accumulate_steps
+  baseline = None
+  print('workers  sec/step  examples/sec  speedup')
+  for num_workers in [int(n) for n in args.workers.split(',')]:
+    sec_per_step = run(num_workers, args)
+    throughput = num_workers * examples_per_batch / sec_per_step
+    baseline = baseline or throughput
+    print('%7d  %8.3f  %12.1f  %6.2fx' % (num_workers, sec_per_step, throughput, throughput / baseline))
+
+
+if __name__ == '__main__':
+  main()
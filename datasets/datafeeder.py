@@ -15,19 +15,34 @@ _pad = 0
 
 
 class DataFeeder(threading.Thread):
-  '''Feeds batches of data into a queue on a background thread.'''
+  '''Feeds batches of data into a queue on a background thread.
 
-  def __init__(self, coordinator, metadata_filename, hparams):
+  With num_shards > 1 (one feeder per training worker), only every num_shards-th example starting
+  at shard_index is used. With hparams.outputs_per_step_schedule, the reduction factor for each
+  group of batches is looked up from global_step and enqueued with the batches.
+  '''
+
+  def __init__(self, coordinator, metadata_filename, hparams, shard_index=0, num_shards=1,
+               global_step=None):
     super(DataFeeder, self).__init__()
     self._coord = coordinator
     self._hparams = hparams
     self._cleaner_names = [x.strip() for x in hparams.cleaners.split(',')]
     self._offset = 0
+    if hparams.batch_frames_mode not in ('padded', 'total'):
+      raise ValueError('Unknown batch_frames_mode: %s' % hparams.batch_frames_mode)
+    self._global_step = global_step
+    self._schedule = _parse_schedule(hparams.outputs_per_step_schedule,
+      hparams.max_outputs_per_step or hparams.outputs_per_step)
+    if self._schedule and global_step is None:
+      raise ValueError('outputs_per_step_schedule requires global_step')
 
     # Load metadata:
     self._datadir = os.path.dirname(metadata_filename)
     with open(metadata_filename, encoding='utf-8') as f:
-      self._metadata = [line.strip().split('|') for line in f]
+      self._metadata = [line.strip().split('|') for line in f][shard_index::num_shards]
+      if num_shards > 1:
+        log('Using shard %d of %d' % (shard_index, num_shards))
       hours = sum((int(x[2]) for x in self._metadata)) * hparams.frame_shift_ms / (3600 * 1000)
       log('Loaded metadata for %d examples (%.2f hours)' % (len(self._metadata), hours))
 
@@ -37,17 +52,25 @@ class DataFeeder(threading.Thread):
       tf.placeholder(tf.int32, [None, None], 'inputs'),
       tf.placeholder(tf.int32, [None], 'input_lengths'),
       tf.placeholder(tf.float32, [None, None, hparams.num_mels], 'mel_targets'),
-      tf.placeholder(tf.float32, [None, None, hparams.num_freq], 'linear_targets')
+      tf.placeholder(tf.float32, [None, None, hparams.num_freq], 'linear_targets'),
+      tf.placeholder(tf.float32, [], 'padding_efficiency'),
+      tf.placeholder(tf.int32, [], 'outputs_per_step')
     ]
 
     # Create queue for buffering data:
-    queue = tf.FIFOQueue(8, [tf.int32, tf.int32, tf.float32, tf.float32], name='input_queue')
+    queue = tf.FIFOQueue(8, [tf.int32, tf.int32, tf.float32, tf.float32, tf.float32, tf.int32],
+      name='input_queue')
     self._enqueue_op = queue.enqueue(self._placeholders)
-    self.inputs, self.input_lengths, self.mel_targets, self.linear_targets = queue.dequeue()
+    self.inputs, self.input_lengths, self.mel_targets, self.linear_targets, \
+      self.padding_efficiency, self.outputs_per_step = queue.dequeue()
     self.inputs.set_shape(self._placeholders[0].shape)
     self.input_lengths.set_shape(self._placeholders[1].shape)
     self.mel_targets.set_shape(self._placeholders[2].shape)
     self.linear_targets.set_shape(self._placeholders[3].shape)
+    self.padding_efficiency.set_shape(self._placeholders[4].shape)
+    self.outputs_per_step.set_shape(self._placeholders[5].shape)
+    self.queue_size = queue.size()
+    tf.summary.scalar('queue_size', self.queue_size)
 
     # Load CMUDict: If enabled, this will randomly substitute some words in the training data with
     # their ARPABet equivalents, which will allow you to also pass ARPABet to the model for
@@ -82,20 +105,35 @@ class DataFeeder(threading.Thread):
 
     # Read a group of examples:
     n = self._hparams.batch_size
-    r = self._hparams.outputs_per_step
+    r = self._current_outputs_per_step()
     examples = [self._get_next_example() for i in range(n * _batches_per_group)]
 
     # Bucket examples based on similar output sequence length for efficiency:
     examples.sort(key=lambda x: x[-1])
-    batches = [examples[i:i+n] for i in range(0, len(examples), n)]
+    if self._hparams.batch_frames > 0:
+      batches = _split_by_frames(examples, self._hparams.batch_frames, r,
+        self._hparams.batch_frames_mode)
+    else:
+      batches = [examples[i:i+n] for i in range(0, len(examples), n)]
     random.shuffle(batches)
 
-    log('Generated %d batches of size %d in %.03f sec' % (len(batches), n, time.time() - start))
+    sizes = [len(b) for b in batches]
+    efficiencies = [_padding_efficiency(b, r) for b in batches]
+    log('Generated %d batches of size %d-%d, r=%d in %.03f sec (padding efficiency: avg %.1f%%, min %.1f%%)' % (
+      len(batches), min(sizes), max(sizes), r, time.time() - start,
+      100 * np.mean(efficiencies), 100 * min(efficiencies)))
     for batch in batches:
       feed_dict = dict(zip(self._placeholders, _prepare_batch(batch, r)))
       self._session.run(self._enqueue_op, feed_dict=feed_dict)
 
 
+  def _current_outputs_per_step(self):
+    if not self._schedule:
+      return self._hparams.outputs_per_step
+    step = self._session.run(self._global_step)
+    return _scheduled_outputs_per_step(self._schedule, step, self._hparams.outputs_per_step)
+
+
   def _get_next_example(self):
     '''Loads a single example (input, mel_target, linear_target, cost) from disk'''
     if self._offset >= len(self._metadata):
@@ -119,13 +157,67 @@ class DataFeeder(threading.Thread):
     return '{%s}' % arpabet[0] if arpabet is not None and random.random() < 0.5 else word
 
 
+def _parse_schedule(schedule, max_outputs_per_step):
+  '''Parses "step:r,step:r,..." into a list of (step, r) sorted by step'''
+  entries = sorted(tuple(int(v) for v in x.split(':')) for x in schedule.split(',') if x.strip())
+  if any(r > max_outputs_per_step for _, r in entries):
+    raise ValueError('outputs_per_step_schedule exceeds max_outputs_per_step=%d' %
+      max_outputs_per_step)
+  return entries
+
+
+def _scheduled_outputs_per_step(schedule, step, default):
+  '''Returns r of the last schedule entry starting at or before step, or default if none does'''
+  r = default
+  for start, scheduled_r in schedule:
+    if step >= start:
+      r = scheduled_r
+  return r
+
+
+def _split_by_frames(examples, max_frames, outputs_per_step, mode):
+  '''Greedily packs examples sorted by output length into batches of at most max_frames frames.
+
+  mode='padded' counts n * padded length (what is actually allocated), mode='total' counts the
+  sum of the unpadded output lengths. A single example over the budget gets its own batch.
+  '''
+  batches = []
+  batch = []
+  for example in examples:
+    if batch and _batch_frames(batch + [example], outputs_per_step, mode) > max_frames:
+      batches.append(batch)
+      batch = []
+    batch.append(example)
+  if batch:
+    batches.append(batch)
+  return batches
+
+
+def _batch_frames(batch, outputs_per_step, mode):
+  if mode == 'total':
+    return _round_up(sum(x[-1] for x in batch), outputs_per_step)
+  return len(batch) * _padded_length(batch, outputs_per_step)
+
+
+def _padded_length(batch, outputs_per_step):
+  # Same length as _prepare_targets pads to:
+  return _round_up(max(x[-1] for x in batch) + 1, outputs_per_step)
+
+
+def _padding_efficiency(batch, outputs_per_step):
+  '''Fraction of target frames in the padded batch that are real data'''
+  return sum(x[-1] for x in batch) / (len(batch) * _padded_length(batch, outputs_per_step))
+
+
 def _prepare_batch(batch, outputs_per_step):
   random.shuffle(batch)
   inputs = _prepare_inputs([x[0] for x in batch])
   input_lengths = np.asarray([len(x[0]) for x in batch], dtype=np.int32)
   mel_targets = _prepare_targets([x[1] for x in batch], outputs_per_step)
   linear_targets = _prepare_targets([x[2] for x in batch], outputs_per_step)
-  return (inputs, input_lengths, mel_targets, linear_targets)
+  padding_efficiency = np.float32(_padding_efficiency(batch, outputs_per_step))
+  return (inputs, input_lengths, mel_targets, linear_targets, padding_efficiency,
+    np.int32(outputs_per_step))
 
 
 def _prepare_inputs(inputs):
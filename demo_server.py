@@ -1,9 +1,17 @@
 import argparse
 import falcon
 from hparams import hparams, hparams_debug_string
+import json
 import os
-from synthesizer import Synthesizer
+import random
+import threading
+import time
+import traceback
+from synthesizer import Synthesizer, add_session_arguments, session_config, \
+  session_config_from_args
 from text.pinyinconvert import sentence_to_pinyin
+from util.cache import LRUCache
+from util.metrics import Registry
 
 html_body = '''<html><title>Demo</title>
 <style>
@@ -87,6 +95,94 @@ function synthesize(text) {
 '''
 
 
+metrics = Registry()
+requests_total = metrics.counter('tacotron_requests_total', 'HTTP requests handled.', ['route', 'status'])
+requests_in_flight = metrics.gauge('tacotron_requests_in_flight', 'HTTP requests being handled.')
+request_seconds = metrics.histogram('tacotron_request_seconds', 'HTTP request latency.', ['route'])
+stage_seconds = metrics.histogram('tacotron_stage_seconds', 'Time spent in each synthesis stage.',
+  ['stage'])
+audio_seconds_total = metrics.counter('tacotron_output_audio_seconds_total',
+  'Seconds of audio synthesized.')
+rtf = metrics.histogram('tacotron_real_time_factor',
+  'Synthesis time divided by output audio duration.',
+  buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5))
+cache_requests_total = metrics.counter('tacotron_cache_requests_total',
+  'Synthesis cache lookups.', ['result'])
+cache_hit_ratio = metrics.gauge('tacotron_cache_hit_ratio', 'Fraction of cache lookups that hit.')
+warmup_seconds = metrics.gauge('tacotron_warmup_seconds', 'Time spent warming up at startup.')
+ready_gauge = metrics.gauge('tacotron_ready', '1 once the model is loaded and warmed up.')
+
+# Defaults can be set from the environment when served with e.g. gunicorn:
+cache_size = int(os.environ.get('CACHE_SIZE', 64))
+log_sample_rate = float(os.environ.get('LOG_SAMPLE_RATE', 0.01))
+warmup_lengths = os.environ.get('WARMUP_LENGTHS', '10,50,150')
+ready = threading.Event()
+
+
+def log_request(**fields):
+  '''Logs a sample of requests as one JSON object per line.'''
+  if random.random() < log_sample_rate:
+    print(json.dumps(fields, sort_keys=True), flush=True)
+
+
+class MetricsMiddleware:
+  def process_request(self, req, res):
+    req.context['start'] = time.time()
+    requests_in_flight.inc()
+
+  def process_response(self, req, res, resource, req_succeeded):
+    if 'start' not in req.context:
+      return
+    # uri_template is only available from falcon 1.3:
+    route = getattr(req, 'uri_template', None) or req.path
+    elapsed = time.time() - req.context['start']
+    status = res.status.split()[0]
+    requests_in_flight.dec()
+    requests_total.inc(route=route, status=status)
+    request_seconds.observe(elapsed, route=route)
+    if route != '/metrics':
+      log_request(route=route, status=int(status), seconds=round(elapsed, 4),
+        text_length=len(req.params.get('text', '')), **req.context.get('log', {}))
+
+
+def warmup(lengths):
+  '''Runs the synthesizer on inputs of each length (comma-separated string), then marks the
+  server ready.'''
+  lengths = [int(n) for n in lengths.split(',') if n.strip()]
+  start = time.time()
+  try:
+    durations = synthesizer.warmup(lengths)
+  except Exception:
+    # Otherwise the server would answer 503 forever with nothing but a thread traceback:
+    print('Warmup failed, exiting:\n%s' % traceback.format_exc(), flush=True)
+    os._exit(1)
+  for n, seconds in zip(lengths, durations):
+    print('Warmup: %d symbols in %.03f sec' % (n, seconds), flush=True)
+  warmup_seconds.set(time.time() - start)
+  ready_gauge.set(1)
+  ready.set()
+
+
+def start_warmup(lengths):
+  thread = threading.Thread(target=warmup, args=(lengths,), daemon=True)
+  thread.start()
+  return thread
+
+
+class ReadyResource:
+  def on_get(self, req, res):
+    if not ready.is_set():
+      raise falcon.HTTPServiceUnavailable('Warming up', 'The model is still warming up.', 1)
+    res.content_type = 'text/plain'
+    res.body = 'ready'
+
+
+class MetricsResource:
+  def on_get(self, req, res):
+    res.content_type = 'text/plain; version=0.0.4'
+    res.body = metrics.expose()
+
+
 class UIResource:
   def on_get(self, req, res):
     res.content_type = 'text/html'
@@ -98,22 +194,42 @@ class ConvertResource:
     if not req.params.get('text'):
       raise falcon.HTTPBadRequest()
     res.content_type = 'text/html'
-    print(req.params)
     res.body = sentence_to_pinyin(req.params.get('text'))
 
 class SynthesisResource:
   def on_get(self, req, res):
     if not req.params.get('text'):
       raise falcon.HTTPBadRequest()
-    print(req.params)
-    res.data = synthesizer.synthesize(req.params.get('text'))
+    if not ready.is_set():
+      raise falcon.HTTPServiceUnavailable('Warming up', 'The model is still warming up.', 1)
+    text = req.params.get('text')
+    data = cache.get(text)
+    cache_requests_total.inc(result='hit' if data is not None else 'miss')
+    cache_hit_ratio.set(cache.hit_ratio)
+    if data is None:
+      timings = {}
+      data = synthesizer.synthesize(text, timings)
+      cache.put(text, data)
+      audio_seconds = timings.pop('audio_seconds')
+      for stage, seconds in timings.items():
+        stage_seconds.observe(seconds, stage=stage)
+      audio_seconds_total.inc(audio_seconds)
+      if audio_seconds > 0:
+        rtf.observe(sum(timings.values()) / audio_seconds)
+      req.context['log'] = dict(timings, audio_seconds=audio_seconds, cached=False)
+    else:
+      req.context['log'] = {'cached': True}
+    res.data = data
     res.content_type = 'audio/wav'
 
 
 synthesizer = Synthesizer()
-api = falcon.API()
+cache = LRUCache(cache_size)
+api = falcon.API(middleware=[MetricsMiddleware()])
 api.add_route('/synthesize', SynthesisResource())
 api.add_route('/convert', ConvertResource())
+api.add_route('/metrics', MetricsResource())
+api.add_route('/ready', ReadyResource())
 api.add_route('/', UIResource())
 
 
@@ -124,12 +240,29 @@ if __name__ == '__main__':
   parser.add_argument('--port', type=int, default=9000)
   parser.add_argument('--hparams', default='',
     help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  parser.add_argument('--cache_size', type=int, default=cache_size,
+    help='Number of synthesized texts to keep in memory (0 disables the cache)')
+  parser.add_argument('--log_sample_rate', type=float, default=log_sample_rate,
+    help='Fraction of requests logged as JSON lines')
+  parser.add_argument('--warmup_lengths', default=warmup_lengths,
+    help='Comma-separated input lengths (in symbols) synthesized at startup; empty disables warmup')
+  add_session_arguments(parser)
   args = parser.parse_args()
+  cache.max_entries = args.cache_size
+  log_sample_rate = args.log_sample_rate
   os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
   hparams.parse(args.hparams)
   print(hparams_debug_string())
-  synthesizer.load(args.checkpoint)
+  synthesizer.load(args.checkpoint, config=session_config_from_args(args))
+  start_warmup(args.warmup_lengths)
   print('Serving on port %d' % args.port)
   simple_server.make_server('0.0.0.0', args.port, api).serve_forever()
 else:
-  synthesizer.load(os.environ['CHECKPOINT'])
+  # Same settings as the command line flags, from the environment:
+  config = session_config(
+    intra_op_threads=int(os.environ.get('INTRA_OP_THREADS', 0)),
+    inter_op_threads=int(os.environ.get('INTER_OP_THREADS', 0)),
+    graph_opt_level=int(os.environ.get('GRAPH_OPT_LEVEL', 1)),
+    xla=os.environ.get('XLA', '') not in ('', '0'))
+  synthesizer.load(os.environ['CHECKPOINT'], config=config)
+  start_warmup(warmup_lengths)
@@ -2,7 +2,7 @@ import argparse
 import os
 import re
 from hparams import hparams, hparams_debug_string
-from synthesizer import Synthesizer
+from synthesizer import Synthesizer, add_session_arguments, session_config_from_args
 
 
 sentences = [
@@ -29,7 +29,7 @@ def get_output_base_path(checkpoint_path):
 def run_eval(args):
   print(hparams_debug_string())
   synth = Synthesizer()
-  synth.load(args.checkpoint)
+  synth.load(args.checkpoint, config=session_config_from_args(args))
   base_path = get_output_base_path(args.checkpoint)
   for i, text in enumerate(sentences):
     path = '%s-%d.wav' % (base_path, i)
@@ -43,6 +43,7 @@ def main():
   parser.add_argument('--checkpoint', required=True, help='Path to model checkpoint')
   parser.add_argument('--hparams', default='',
     help='Hyperparameter overrides as a comma-separated list of name=value pairs')
+  add_session_arguments(parser)
   args = parser.parse_args()
   os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
   hparams.parse(args.hparams)
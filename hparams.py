@@ -19,15 +19,23 @@ hparams = tf.contrib.training.HParams(
 
   # Model:
   outputs_per_step=5,
+  max_outputs_per_step=0,   # Frames the decoder projects per step (0: outputs_per_step). Set it to
+                            # the largest r to be used in training or inference.
   embed_depth=256,
   prenet_depths=[256, 128],
   encoder_depth=256,
   postnet_depth=256,
   attention_depth=256,
   decoder_depth=256,
+  attention_window=0,       # If > 0, attend to this many encoder steps around the last peak at inference
+  attention_window_backward=3,  # Encoder steps before the last peak included in the window
 
   # Training:
   batch_size=32,
+  batch_frames=0,           # If > 0, batch by a budget of target frames instead of batch_size
+  batch_frames_mode='padded',  # 'padded': n * padded max length, 'total': sum of output lengths
+  outputs_per_step_schedule='',  # e.g. '0:7,20000:5,60000:3': reduction factor from each step on
+  accumulate_steps=1,       # Number of batches to accumulate gradients over before each update
   adam_beta1=0.9,
   adam_beta2=0.999,
   initial_learning_rate=0.002,
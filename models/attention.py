@@ -0,0 +1,37 @@
+import tensorflow as tf
+from tensorflow.contrib.seq2seq import BahdanauAttention
+
+
+class WindowedBahdanauAttention(BahdanauAttention):
+  '''Bahdanau attention over a window of encoder steps around the previous alignment peak.
+
+  Only window encoder steps, starting window_backward steps before the argmax of the previous
+  alignments, are scored, so the cost of each decoder step does not grow with the input length
+  and attention cannot jump far ahead or back. The alignments are scattered back to [N, T_in],
+  so alignment_history works as with BahdanauAttention. Variables are the same as those of
+  BahdanauAttention (with normalize=False), so a model trained with full attention can be loaded.
+  '''
+  def __init__(self, num_units, memory, window, window_backward, name='WindowedBahdanauAttention'):
+    super(WindowedBahdanauAttention, self).__init__(num_units, memory, name=name)
+    self._window = window
+    self._window_backward = window_backward
+
+  def __call__(self, query, state):
+    with tf.variable_scope(None, 'bahdanau_attention', [query]):
+      processed_query = self.query_layer(query)                                # [N, num_units]
+      batch_size = tf.shape(self._keys)[0]
+      max_time = tf.shape(self._keys)[1]
+      width = tf.minimum(self._window, max_time)
+
+      # Window of encoder steps for each batch entry:
+      peak = tf.argmax(state, axis=-1, output_type=tf.int32)
+      start = tf.clip_by_value(peak - self._window_backward, 0, max_time - width)  # [N]
+      positions = tf.expand_dims(start, 1) + tf.expand_dims(tf.range(width), 0)    # [N, W]
+      batch_ids = tf.tile(tf.expand_dims(tf.range(batch_size), 1), [1, width])
+      indices = tf.stack([batch_ids, positions], axis=-1)                          # [N, W, 2]
+      keys = tf.gather_nd(self._keys, indices)                                     # [N, W, num_units]
+
+      v = tf.get_variable('attention_v', [self._num_units], dtype=keys.dtype)
+      score = tf.reduce_sum(v * tf.tanh(keys + tf.expand_dims(processed_query, 1)), [2])
+    alignments = tf.scatter_nd(indices, tf.nn.softmax(score), tf.shape(state))   # [N, T_in]
+    return alignments, alignments
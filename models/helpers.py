@@ -5,10 +5,13 @@ from tensorflow.contrib.seq2seq import Helper
 
 # Adapted from tf.contrib.seq2seq.GreedyEmbeddingHelper
 class TacoTestHelper(Helper):
-  def __init__(self, batch_size, output_dim, r):
+  def __init__(self, batch_size, output_dim, r, initial_inputs=None):
+    # initial_inputs is [N, output_dim]; defaults to <GO> frames.
     with tf.name_scope('TacoTestHelper'):
       self._batch_size = batch_size
       self._output_dim = output_dim
+      self._initial_inputs = initial_inputs
+      self._r = r
       self._end_token = tf.tile([0.0], [output_dim * r])
 
   @property
@@ -24,6 +27,8 @@ class TacoTestHelper(Helper):
     return np.int32
 
   def initialize(self, name=None):
+    if self._initial_inputs is not None:
+      return (tf.tile([False], [self._batch_size]), self._initial_inputs)
     return (tf.tile([False], [self._batch_size]), _go_frames(self._batch_size, self._output_dim))
 
   def sample(self, time, outputs, state, name=None):
@@ -32,8 +37,10 @@ class TacoTestHelper(Helper):
   def next_inputs(self, time, outputs, state, sample_ids, name=None):
     '''Stop on EOS. Otherwise, pass the last output as the next input and pass through state.'''
     with tf.name_scope('TacoTestHelper'):
+      # outputs is [N, output_dim * max_r]; only the first r frames are used.
+      outputs = outputs[:, :self._output_dim * self._r]
       finished = tf.reduce_all(tf.equal(outputs, self._end_token), axis=1)
-      # Feed last output frame as next input. outputs is [N, output_dim * r]
+      # Feed last output frame as next input.
       next_inputs = outputs[:, -self._output_dim:]
       return (finished, next_inputs, state)
 
@@ -1,9 +1,11 @@
 import tensorflow as tf
 from tensorflow.contrib.rnn import GRUCell, MultiRNNCell, OutputProjectionWrapper, ResidualWrapper
 from tensorflow.contrib.seq2seq import BasicDecoder, BahdanauAttention, AttentionWrapper
+from tensorflow.python.util import nest
 from text.symbols import symbols
 from util.infolog import log
-from .helpers import TacoTestHelper, TacoTrainingHelper
+from .attention import WindowedBahdanauAttention
+from .helpers import TacoTestHelper, TacoTrainingHelper, _go_frames
 from .modules import encoder_cbhg, post_cbhg, prenet
 from .rnn_wrappers import DecoderPrenetWrapper, ConcatOutputAndAttentionWrapper
 
@@ -14,7 +16,8 @@ class Tacotron():
     self._hparams = hparams
 
 
-  def initialize(self, inputs, input_lengths, mel_targets=None, linear_targets=None):
+  def initialize(self, inputs, input_lengths, mel_targets=None, linear_targets=None,
+                 outputs_per_step=None):
     '''Initializes the model for inference.
 
     Sets "mel_outputs", "linear_outputs", and "alignments" fields.
@@ -30,58 +33,34 @@ class Tacotron():
       linear_targets: float32 Tensor with shape [N, T_out, F] where N is batch_size, T_out is number
         of steps in the output time series, F is num_freq, and values are entries in the linear
         spectrogram. Only needed for training.
+      outputs_per_step: reduction factor r, as an int or int32 scalar Tensor. Must not be larger
+        than max_outputs_per_step. Defaults to hparams.outputs_per_step.
     '''
     with tf.variable_scope('inference') as scope:
       is_training = linear_targets is not None
       batch_size = tf.shape(inputs)[0]
       hp = self._hparams
+      r = hp.outputs_per_step if outputs_per_step is None else outputs_per_step
+      max_r = hp.max_outputs_per_step or hp.outputs_per_step
 
-      # Embeddings
-      embedding_table = tf.get_variable(
-        'embedding', [len(symbols), hp.embed_depth], dtype=tf.float32,
-        initializer=tf.truncated_normal_initializer(stddev=0.5))
-      embedded_inputs = tf.nn.embedding_lookup(embedding_table, inputs)          # [N, T_in, embed_depth=256]
-
-      # Encoder
-      prenet_outputs = prenet(embedded_inputs, is_training, hp.prenet_depths)    # [N, T_in, prenet_depths[-1]=128]
-      encoder_outputs = encoder_cbhg(prenet_outputs, input_lengths, is_training, # [N, T_in, encoder_depth=256]
-                                     hp.encoder_depth)
-
-      # Attention
-      attention_cell = AttentionWrapper(
-        GRUCell(hp.attention_depth),
-        BahdanauAttention(hp.attention_depth, encoder_outputs),
-        alignment_history=True,
-        output_attention=False)                                                  # [N, T_in, attention_depth=256]
-      
-      # Apply prenet before concatenation in AttentionWrapper.
-      attention_cell = DecoderPrenetWrapper(attention_cell, is_training, hp.prenet_depths)
-
-      # Concatenate attention context vector and RNN cell output into a 2*attention_depth=512D vector.
-      concat_cell = ConcatOutputAndAttentionWrapper(attention_cell)              # [N, T_in, 2*attention_depth=512]
-
-      # Decoder (layers specified bottom to top):
-      decoder_cell = MultiRNNCell([
-          OutputProjectionWrapper(concat_cell, hp.decoder_depth),
-          ResidualWrapper(GRUCell(hp.decoder_depth)),
-          ResidualWrapper(GRUCell(hp.decoder_depth))
-        ], state_is_tuple=True)                                                  # [N, T_in, decoder_depth=256]
-
-      # Project onto r mel spectrograms (predict r outputs at each RNN step):
-      output_cell = OutputProjectionWrapper(decoder_cell, hp.num_mels * hp.outputs_per_step)
+      embedded_inputs, prenet_outputs, encoder_outputs = self._encode(
+        inputs, input_lengths, is_training)
+      attention_cell, concat_cell, decoder_cell, output_cell = self._decoder_cell(
+        encoder_outputs, is_training, alignment_history=True)
       decoder_init_state = output_cell.zero_state(batch_size=batch_size, dtype=tf.float32)
 
       if is_training:
-        helper = TacoTrainingHelper(inputs, mel_targets, hp.num_mels, hp.outputs_per_step)
+        helper = TacoTrainingHelper(inputs, mel_targets, hp.num_mels, r)
       else:
-        helper = TacoTestHelper(batch_size, hp.num_mels, hp.outputs_per_step)
+        helper = TacoTestHelper(batch_size, hp.num_mels, r)
 
       (decoder_outputs, _), final_decoder_state, _ = tf.contrib.seq2seq.dynamic_decode(
         BasicDecoder(output_cell, helper, decoder_init_state),
         maximum_iterations=hp.max_iters)                                         # [N, T_out/r, M*r]
 
       # Reshape outputs to be one output per entry
-      mel_outputs = tf.reshape(decoder_outputs, [batch_size, -1, hp.num_mels])   # [N, T_out, M]
+      decoder_frames = tf.reshape(decoder_outputs, [batch_size, -1, max_r, hp.num_mels])[:, :, :r]
+      mel_outputs = tf.reshape(decoder_frames, [batch_size, -1, hp.num_mels])    # [N, T_out, M]
 
       # Add post-processing CBHG:
       post_outputs = post_cbhg(mel_outputs, hp.num_mels, is_training,            # [N, T_out, postnet_depth=256]
@@ -93,6 +72,8 @@ class Tacotron():
 
       self.inputs = inputs
       self.input_lengths = input_lengths
+      self.outputs_per_step = r
+      self.encoder_outputs = encoder_outputs
       self.mel_outputs = mel_outputs
       self.linear_outputs = linear_outputs
       self.alignments = alignments
@@ -105,12 +86,126 @@ class Tacotron():
       log('  attention out:           %d' % attention_cell.output_size)
       log('  concat attn & out:       %d' % concat_cell.output_size)
       log('  decoder cell out:        %d' % decoder_cell.output_size)
-      log('  decoder out (%d frames):  %d' % (hp.outputs_per_step, decoder_outputs.shape[-1]))
+      log('  decoder out (%d frames):  %d' % (max_r, decoder_outputs.shape[-1]))
       log('  decoder out (1 frame):   %d' % mel_outputs.shape[-1])
       log('  postnet out:             %d' % post_outputs.shape[-1])
       log('  linear out:              %d' % linear_outputs.shape[-1])
 
 
+  def initialize_streaming(self, inputs, input_lengths):
+    '''Initializes the model for step-wise inference, to produce output while decoding.
+
+    Running "mel_outputs" decodes up to "chunk_steps" decoder steps (a feedable scalar, default 10)
+    and "final_decoder_state" and "finished" give the state to continue from and whether the stop
+    frame was reached. To continue, feed the previous final state to "decoder_state", the last mel
+    frame to "decoder_inputs" and the encoder output of the first run to "encoder_outputs" (so the
+    encoder is not run again). By default these are the zero state, the <GO> frame and the encoder
+    run on "inputs". Alignment history is not kept.
+
+    The post-processing CBHG runs separately, from "post_inputs" (mel frames, [N, T, M]) to
+    "linear_outputs", so that it can be applied to chunks of frames. Variable names are the same
+    as with initialize, so it loads the same checkpoints (in a separate graph).
+
+    Args:
+      inputs: int32 Tensor with shape [N, T_in] of character IDs
+      input_lengths: int32 Tensor with shape [N] of lengths of each sequence in inputs
+    '''
+    with tf.variable_scope('inference') as scope:
+      batch_size = tf.shape(inputs)[0]
+      hp = self._hparams
+      r = hp.outputs_per_step
+      max_r = hp.max_outputs_per_step or hp.outputs_per_step
+
+      _, _, encoder_outputs = self._encode(inputs, input_lengths, False)
+      encoder_outputs = tf.placeholder_with_default(encoder_outputs, encoder_outputs.shape)
+      _, _, _, output_cell = self._decoder_cell(encoder_outputs, False, alignment_history=False)
+
+      # Feedable decoder state and inputs, defaulting to the start of the utterance:
+      decoder_state = nest.map_structure(lambda t: tf.placeholder_with_default(t, t.shape),
+        output_cell.zero_state(batch_size=batch_size, dtype=tf.float32))
+      decoder_inputs = tf.placeholder_with_default(
+        _go_frames(batch_size, hp.num_mels), [None, hp.num_mels])
+      chunk_steps = tf.placeholder_with_default(10, [])
+
+      helper = TacoTestHelper(batch_size, hp.num_mels, r, initial_inputs=decoder_inputs)
+      (decoder_outputs, _), final_decoder_state, _ = tf.contrib.seq2seq.dynamic_decode(
+        BasicDecoder(output_cell, helper, decoder_state),
+        maximum_iterations=chunk_steps)                                          # [N, steps, M*r]
+
+      # Same stop condition as TacoTestHelper, on the last step of the chunk:
+      finished = tf.reduce_all(tf.equal(decoder_outputs[:, -1, :hp.num_mels * r], 0.0))
+      decoder_frames = tf.reshape(decoder_outputs, [batch_size, -1, max_r, hp.num_mels])[:, :, :r]
+      mel_outputs = tf.reshape(decoder_frames, [batch_size, -1, hp.num_mels])    # [N, steps*r, M]
+
+      post_inputs = tf.placeholder(tf.float32, [None, None, hp.num_mels], 'post_inputs')
+      post_outputs = post_cbhg(post_inputs, hp.num_mels, False, hp.postnet_depth)
+      linear_outputs = tf.layers.dense(post_outputs, hp.num_freq)                # [N, T, F]
+
+      self.inputs = inputs
+      self.input_lengths = input_lengths
+      self.outputs_per_step = r
+      self.encoder_outputs = encoder_outputs
+      self.decoder_state = decoder_state
+      self.decoder_inputs = decoder_inputs
+      self.chunk_steps = chunk_steps
+      self.mel_outputs = mel_outputs
+      self.final_decoder_state = final_decoder_state
+      self.finished = finished
+      self.post_inputs = post_inputs
+      self.linear_outputs = linear_outputs
+      log('Initialized Tacotron model for streaming inference.')
+
+
+  def _encode(self, inputs, input_lengths, is_training):
+    hp = self._hparams
+    # Embeddings
+    embedding_table = tf.get_variable(
+      'embedding', [len(symbols), hp.embed_depth], dtype=tf.float32,
+      initializer=tf.truncated_normal_initializer(stddev=0.5))
+    embedded_inputs = tf.nn.embedding_lookup(embedding_table, inputs)          # [N, T_in, embed_depth=256]
+
+    # Encoder
+    prenet_outputs = prenet(embedded_inputs, is_training, hp.prenet_depths)    # [N, T_in, prenet_depths[-1]=128]
+    encoder_outputs = encoder_cbhg(prenet_outputs, input_lengths, is_training, # [N, T_in, encoder_depth=256]
+                                   hp.encoder_depth)
+    return embedded_inputs, prenet_outputs, encoder_outputs
+
+
+  def _decoder_cell(self, encoder_outputs, is_training, alignment_history):
+    hp = self._hparams
+    max_r = hp.max_outputs_per_step or hp.outputs_per_step
+
+    # Attention. At inference, optionally only attend to a window around the last alignment peak:
+    if hp.attention_window > 0 and not is_training:
+      attention_mechanism = WindowedBahdanauAttention(hp.attention_depth, encoder_outputs,
+        hp.attention_window, hp.attention_window_backward)
+    else:
+      attention_mechanism = BahdanauAttention(hp.attention_depth, encoder_outputs)
+    attention_cell = AttentionWrapper(
+      GRUCell(hp.attention_depth),
+      attention_mechanism,
+      alignment_history=alignment_history,
+      output_attention=False)                                                  # [N, T_in, attention_depth=256]
+    
+    # Apply prenet before concatenation in AttentionWrapper.
+    attention_cell = DecoderPrenetWrapper(attention_cell, is_training, hp.prenet_depths)
+
+    # Concatenate attention context vector and RNN cell output into a 2*attention_depth=512D vector.
+    concat_cell = ConcatOutputAndAttentionWrapper(attention_cell)              # [N, T_in, 2*attention_depth=512]
+
+    # Decoder (layers specified bottom to top):
+    decoder_cell = MultiRNNCell([
+        OutputProjectionWrapper(concat_cell, hp.decoder_depth),
+        ResidualWrapper(GRUCell(hp.decoder_depth)),
+        ResidualWrapper(GRUCell(hp.decoder_depth))
+      ], state_is_tuple=True)                                                  # [N, T_in, decoder_depth=256]
+
+    # Project onto max_r mel spectrograms (predict up to max_r outputs at each RNN step). Only the
+    # first r are used, so one model can be trained and run with different reduction factors:
+    output_cell = OutputProjectionWrapper(decoder_cell, hp.num_mels * max_r)
+    return attention_cell, concat_cell, decoder_cell, output_cell
+
+
   def add_loss(self):
     '''Adds loss to the model. Sets "loss" field. initialize must have been called.'''
     with tf.variable_scope('loss') as scope:
@@ -123,11 +218,22 @@ class Tacotron():
       self.loss = self.mel_loss + self.linear_loss
 
 
-  def add_optimizer(self, global_step):
+  def add_optimizer(self, global_step, num_replicas=1, worker_device=None):
     '''Adds optimizer. Sets "gradients" and "optimize" fields. add_loss must have been called.
 
+    With hparams.accumulate_steps > 1, also sets "accumulate". Each run of "accumulate" adds the
+    clipped gradients of one dequeued batch to local accumulators; "optimize" adds the last batch,
+    applies the averaged gradients and resets the accumulators. global_step (and so the learning
+    rate schedule) advances once per apply, i.e. once per accumulate_steps batches.
+
+    With num_replicas > 1, updates are synchronized across workers with SyncReplicasOptimizer,
+    which is stored in "sync_optimizer"; each update averages the gradients of all replicas.
+
     Args:
       global_step: int32 scalar Tensor representing current global step in training
+      num_replicas: number of workers training in parallel
+      worker_device: device of this worker in distributed training; gradient accumulators are
+        placed there
     '''
     with tf.variable_scope('optimizer') as scope:
       hp = self._hparams
@@ -136,6 +242,12 @@ class Tacotron():
       else:
         self.learning_rate = tf.convert_to_tensor(hp.initial_learning_rate)
       optimizer = tf.train.AdamOptimizer(self.learning_rate, hp.adam_beta1, hp.adam_beta2)
+      if num_replicas > 1:
+        optimizer = tf.train.SyncReplicasOptimizer(optimizer,
+          replicas_to_aggregate=num_replicas, total_num_replicas=num_replicas)
+        self.sync_optimizer = optimizer
+      else:
+        self.sync_optimizer = None
       gradients, variables = zip(*optimizer.compute_gradients(self.loss))
       self.gradients = gradients
       clipped_gradients, _ = tf.clip_by_global_norm(gradients, 1.0)
@@ -143,8 +255,29 @@ class Tacotron():
       # Add dependency on UPDATE_OPS; otherwise batchnorm won't work correctly. See:
       # https://github.com/tensorflow/tensorflow/issues/1122
       with tf.control_dependencies(tf.get_collection(tf.GraphKeys.UPDATE_OPS)):
-        self.optimize = optimizer.apply_gradients(zip(clipped_gradients, variables),
-          global_step=global_step)
+        if hp.accumulate_steps > 1:
+          self._accumulators, self.accumulate = _accumulate(clipped_gradients, variables,
+            worker_device)
+          with tf.control_dependencies([self.accumulate]):
+            averaged = [tf.identity(a) / hp.accumulate_steps for a in self._accumulators]
+          apply_op = optimizer.apply_gradients(zip(averaged, variables), global_step=global_step)
+          with tf.control_dependencies([apply_op]):
+            self.optimize = tf.group(*[a.assign(tf.zeros_like(a)) for a in self._accumulators])
+        else:
+          self.optimize = optimizer.apply_gradients(zip(clipped_gradients, variables),
+            global_step=global_step)
+
+
+def _accumulate(gradients, variables, worker_device=None):
+  # Local variables, so checkpoints stay compatible with accumulate_steps=1. replica_device_setter
+  # places every variable on the ps regardless of its collection, and all workers use the same
+  # names, so without an explicit worker device they would add into and reset each other's sums:
+  with tf.device(worker_device):
+    accumulators = [tf.Variable(tf.zeros(v.shape, v.dtype.base_dtype), trainable=False,
+      collections=[tf.GraphKeys.LOCAL_VARIABLES], name='%s_accum' % v.op.name.split('/')[-1])
+      for v in variables]
+  return accumulators, tf.group(*[a.assign_add(tf.convert_to_tensor(g))
+    for a, g in zip(accumulators, gradients)])
 
 
 def _learning_rate_decay(init_lr, global_step):
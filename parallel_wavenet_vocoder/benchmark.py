@@ -0,0 +1,366 @@
+# coding: utf-8
+"""
+Benchmarks for the vocoder (inference on CPU, data loading).
+
+usage:
+    benchmark.py student [options] <checkpoint> <scripted>
+    benchmark.py quantize [options] <checkpoint> <mel>...
+    benchmark.py layer [options]
+    benchmark.py datasource [options] <data_root>
+    benchmark.py collate [options]
+    benchmark.py vocoder [options]
+
+commands:
+    student     Eager vs TorchScript (see export_student.py) student inference.
+    quantize    fp32 vs dynamic int8 inference: speed and log-spectral distance.
+    layer       Unfused vs fused incremental step of a single residual block.
+    datasource  Training DataLoader throughput, full vs memory-mapped loading.
+    collate     collate_fn time per batch for raw, mulaw and mulaw-quantize input.
+    vocoder     Teacher (incremental) and student vocoding: latency and real-time factor.
+
+options:
+    --hparams=<parmas>                Hyper parameters [default: ].
+    --preset=<json>                   Path of preset parameters (json).
+    --frames=<N>                      Mel frames per utterance [default: 200].
+    --repeat=<N>                      Number of timed runs [default: 5].
+    --model=<name>                    Model to quantize, student or teacher [default: student].
+    --max-frames=<N>                  Crop mel files to N frames (teacher is slow) [default: 100].
+    --seed=<N>                        Random seed shared by fp32 and int8 runs [default: 1234].
+    --steps=<N>                       Incremental steps per timed run [default: 1000].
+    --batches=<N>                     Batches per timed run [default: 100].
+    --speaker-id=<id>                 Use only this speaker (for multi-speaker data).
+    --teacher=<path>                  Teacher checkpoint (random weights if not given).
+    --student=<path>                  Student checkpoint (random weights if not given).
+    --json=<path>                     Also write the results as JSON.
+    -h, --help               Show help message.
+"""
+from docopt import docopt
+
+import json
+import resource
+import sys
+import time
+
+import numpy as np
+import torch
+
+from hparams import hparams
+
+
+device = torch.device("cpu")
+
+
+def _timeit(f, repeat):
+    """Run ``f`` ``repeat`` times and return durations in seconds"""
+    durations = []
+    for _ in range(repeat):
+        start_time = time.time()
+        f()
+        durations.append(time.time() - start_time)
+    return durations
+
+
+def _report(name, durations, num_samples=None):
+    msg = "{:<24} median {:8.3f} ms  min {:8.3f} ms".format(
+        name, np.median(durations) * 1000, np.min(durations) * 1000)
+    if num_samples is not None:
+        msg += "  {:10.1f} samples/sec".format(num_samples / np.median(durations))
+    print(msg)
+
+
+def _load_student(checkpoint_path):
+    from train_student import build_model
+    model = build_model(name='student').to(device)
+    checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    model.make_generation_fast_()
+    return model
+
+
+def _load_teacher(checkpoint_path):
+    from train import build_model
+    model = build_model().to(device)
+    checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+    model.load_state_dict(checkpoint["state_dict"])
+    model.eval()
+    model.make_generation_fast_()
+    return model
+
+
+def _log_spectral_distance(x, y):
+    """Mean over frames of the RMS difference of log power spectra (dB)"""
+    import librosa
+    import utils.audio as audio
+    T = min(len(x), len(y))
+    kwargs = dict(n_fft=hparams.fft_size, hop_length=audio.get_hop_size())
+    X = np.abs(librosa.stft(x[:T].astype(np.float32), **kwargs)) ** 2
+    Y = np.abs(librosa.stft(y[:T].astype(np.float32), **kwargs)) ** 2
+    diff = 10 * np.log10(X + 1e-10) - 10 * np.log10(Y + 1e-10)
+    return np.mean(np.sqrt(np.mean(diff ** 2, axis=0)))
+
+
+def _random_features(frames):
+    """Random local conditioning features (1 x C x T') and noise (1 x 1 x T)"""
+    import utils.audio as audio
+    hop_size = audio.get_hop_size()
+    if hparams.upsample_conditional_features:
+        c = torch.rand(1, hparams.cin_channels, frames)
+    else:
+        c = torch.rand(1, hparams.cin_channels, frames * hop_size)
+    z = torch.randn(1, 1, frames * hop_size)
+    return c, z
+
+
+def bench_student(args):
+    checkpoint_path = args["<checkpoint>"]
+    scripted_path = args["<scripted>"]
+    repeat = int(args["--repeat"])
+    c, z = _random_features(int(args["--frames"]))
+    T = z.size(-1)
+
+    models = {}
+
+    def load_eager():
+        models["eager"] = _load_student(checkpoint_path)
+
+    def load_scripted():
+        models["scripted"] = torch.jit.load(scripted_path, map_location=device)
+
+    _report("load (eager)", _timeit(load_eager, repeat))
+    _report("load (scripted)", _timeit(load_scripted, repeat))
+
+    eager, scripted = models["eager"], models["scripted"]
+    with torch.no_grad():
+        # warmup
+        eager(z, c=c, log_scale_min=hparams.log_scale_min)
+        scripted(z, c)
+        _report("generate (eager)", _timeit(
+            lambda: eager(z, c=c, log_scale_min=hparams.log_scale_min), repeat), T)
+        _report("generate (scripted)", _timeit(lambda: scripted(z, c), repeat), T)
+
+
+def bench_quantize(args):
+    checkpoint_path = args["<checkpoint>"]
+    model_name = args["--model"]
+    max_frames = int(args["--max-frames"])
+    seed = int(args["--seed"])
+
+    if model_name == "student":
+        import synthesis_student as synthesis
+        load = _load_student
+
+        def generate(model, c):
+            return synthesis.wavegen(model, c=c)
+    elif model_name == "teacher":
+        import synthesis
+        load = _load_teacher
+
+        def generate(model, c):
+            return synthesis.wavegen(model, c=c, fast=True, tqdm=lambda x: x)
+    else:
+        raise ValueError("Unknown model: {}".format(model_name))
+    synthesis.device = device
+
+    fp32 = load(checkpoint_path)
+    int8 = load(checkpoint_path)
+    int8.quantize_()
+
+    results = {"fp32": [], "int8": []}
+    distances = []
+    num_samples = 0
+    for path in args["<mel>"]:
+        c = np.load(path)
+        if c.shape[1] != hparams.num_mels:
+            c = c.T
+        c = c[:max_frames]
+        waveforms = {}
+        for name, model in [("fp32", fp32), ("int8", int8)]:
+            def f():
+                torch.manual_seed(seed)
+                np.random.seed(seed)
+                waveforms[name] = generate(model, c)
+            results[name].extend(_timeit(f, 1))
+        num_samples += len(waveforms["fp32"])
+        distances.append(_log_spectral_distance(waveforms["fp32"], waveforms["int8"]))
+        print("{}: LSD {:.3f} dB".format(path, distances[-1]))
+
+    for name in ["fp32", "int8"]:
+        _report("generate ({})".format(name), results[name])
+        print("{:<24} {:10.1f} samples/sec".format(
+            "", num_samples / np.sum(results[name])))
+    print("Mean LSD int8 vs fp32: {:.3f} dB".format(np.mean(distances)))
+
+
+def bench_layer(args):
+    from wavenet_vocoder.modules import ResidualConv1dGLU
+    repeat = int(args["--repeat"])
+    steps = int(args["--steps"])
+    cin_channels = hparams.cin_channels
+    gin_channels = hparams.gin_channels
+
+    layer = ResidualConv1dGLU(
+        hparams.residual_channels, hparams.gate_channels,
+        kernel_size=hparams.kernel_size, skip_out_channels=hparams.skip_out_channels,
+        dilation=2 ** 9, cin_channels=cin_channels, gin_channels=gin_channels,
+        weight_normalization=False).to(device)
+    layer.eval()
+
+    x = torch.randn(1, steps, hparams.residual_channels)
+    c = torch.randn(1, steps, cin_channels) if cin_channels > 0 else None
+    g = torch.randn(1, steps, gin_channels) if gin_channels > 0 else None
+
+    def run():
+        layer.clear_buffer()
+        outputs = []
+        for t in range(steps):
+            ct = None if c is None else c[:, t:t + 1]
+            gt = None if g is None else g[:, t:t + 1]
+            outputs.append(layer.incremental_forward(x[:, t:t + 1], ct, gt)[0])
+        return torch.cat(outputs, dim=1)
+
+    with torch.no_grad():
+        y = run()
+        _report("step (unfused)", [d / steps for d in _timeit(run, repeat)])
+        layer.make_fused_()
+        y_fused = run()
+        _report("step (fused)", [d / steps for d in _timeit(run, repeat)])
+    print("Max abs difference: {}".format((y - y_fused).abs().max().item()))
+
+
+def bench_datasource(args):
+    from train import get_data_loaders
+    data_root = args["<data_root>"]
+    repeat = int(args["--repeat"])
+    num_batches = int(args["--batches"])
+    speaker_id = args["--speaker-id"]
+    speaker_id = None if speaker_id is None else int(speaker_id)
+
+    for name, mmap_mode in [("full load", None), ("mmap", "r")]:
+        data_loader = get_data_loaders(data_root, speaker_id, mmap_mode=mmap_mode)["train"]
+        num_samples = []
+
+        def f():
+            num_samples.append(0)
+            for i, (x, y, c, g, input_lengths) in enumerate(data_loader):
+                num_samples[-1] += int(input_lengths.sum())
+                if i + 1 >= num_batches:
+                    break
+
+        # warmup (page cache, worker startup)
+        f()
+        durations = _timeit(f, repeat)
+        _report("{} ({} batches)".format(name, num_batches), durations,
+                np.mean(num_samples[1:]))
+
+
+def bench_collate(args):
+    import utils.audio as audio
+    from train import collate_fn, get_max_time_steps
+    repeat = int(args["--repeat"])
+    num_batches = int(args["--batches"])
+    hop_size = audio.get_hop_size()
+    max_frames = get_max_time_steps() // hop_size
+
+    def random_batch(input_type):
+        batch = []
+        for _ in range(hparams.batch_size):
+            frames = np.random.randint(max_frames // 2, max_frames + 1)
+            if input_type == "mulaw-quantize":
+                x = np.random.randint(0, hparams.quantize_channels, size=frames * hop_size)
+            else:
+                x = np.random.uniform(-1, 1, size=frames * hop_size).astype(np.float32)
+            c = np.random.rand(frames, hparams.cin_channels).astype(np.float32)
+            batch.append((x, c, None))
+        return batch
+
+    input_type = hparams.input_type
+    for t in ["raw", "mulaw", "mulaw-quantize"]:
+        hparams.set_hparam("input_type", t)
+        batches = [random_batch(t) for _ in range(num_batches)]
+
+        def f():
+            for batch in batches:
+                collate_fn(batch)
+
+        _report("collate ({})".format(t), [d / num_batches for d in _timeit(f, repeat)])
+    hparams.set_hparam("input_type", input_type)
+
+
+def _latency(durations, audio_seconds):
+    return {
+        "runs": len(durations),
+        "mean": float(np.mean(durations)),
+        "p50": float(np.percentile(durations, 50)),
+        "p90": float(np.percentile(durations, 90)),
+        "p99": float(np.percentile(durations, 99)),
+        "audio_seconds": float(audio_seconds),
+        "rtf": float(np.mean(durations) / audio_seconds),
+    }
+
+
+def bench_vocoder(args):
+    import utils.audio as audio
+    import synthesis
+    import synthesis_student
+    from train import build_model as build_teacher
+    from train_student import build_model as build_student
+    repeat = int(args["--repeat"])
+    frames = int(args["--frames"])
+    c = np.random.rand(frames, hparams.cin_channels).astype(np.float32)
+    audio_seconds = frames * audio.get_hop_size() / hparams.sample_rate
+    synthesis.device = device
+    synthesis_student.device = device
+
+    def random_model(build):
+        model = build().to(device)
+        model.eval()
+        model.make_generation_fast_()
+        return model
+
+    results = {}
+    for name, checkpoint_path, load, build, generate in [
+            ("teacher_incremental", args["--teacher"], _load_teacher, build_teacher,
+             lambda model: synthesis.wavegen(model, c=c, fast=True, tqdm=lambda x: x)),
+            ("student", args["--student"], _load_student, lambda: build_student(name="student"),
+             lambda model: synthesis_student.wavegen(model, c=c))]:
+        model = random_model(build) if checkpoint_path is None else load(checkpoint_path)
+        with torch.no_grad():
+            generate(model)  # warmup
+            durations = _timeit(lambda: generate(model), repeat)
+        _report(name, durations, audio_seconds * hparams.sample_rate)
+        results[name] = _latency(durations, audio_seconds)
+        results[name]["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        print("{:<24} RTF {:.3f}".format("", results[name]["rtf"]))
+
+    if args["--json"] is not None:
+        with open(args["--json"], "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    preset = args["--preset"]
+
+    # Load preset if specified
+    if preset is not None:
+        with open(preset) as f:
+            hparams.parse_json(f.read())
+    # Override hyper parameters
+    hparams.parse(args["--hparams"])
+    assert hparams.name == "wavenet_vocoder"
+
+    print("Threads: {}".format(torch.get_num_threads()))
+    if args["student"]:
+        bench_student(args)
+    elif args["quantize"]:
+        bench_quantize(args)
+    elif args["layer"]:
+        bench_layer(args)
+    elif args["datasource"]:
+        bench_datasource(args)
+    elif args["collate"]:
+        bench_collate(args)
+    elif args["vocoder"]:
+        bench_vocoder(args)
+    sys.exit(0)
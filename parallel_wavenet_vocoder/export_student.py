@@ -0,0 +1,77 @@
+# coding: utf-8
+"""
+Export trained student to TorchScript for fast inference.
+
+usage: export_student.py [options] <checkpoint> <dst_path>
+
+options:
+    --hparams=<parmas>                Hyper parameters [default: ].
+    --preset=<json>                   Path of preset parameters (json).
+    --example-frames=<N>              Frames of example features used for tracing [default: 100].
+    --speaker-id=<id>                 Example speaker ID (for multi-speaker model).
+    -h, --help               Show help message.
+"""
+from docopt import docopt
+
+import sys
+import torch
+
+import utils.audio as audio
+from hparams import hparams
+
+
+use_cuda = torch.cuda.is_available()
+device = torch.device("cuda" if use_cuda else "cpu")
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__)
+    print("Command line args:\n", args)
+    checkpoint_path = args["<checkpoint>"]
+    dst_path = args["<dst_path>"]
+    example_frames = int(args["--example-frames"])
+    speaker_id = args["--speaker-id"]
+    speaker_id = None if speaker_id is None else int(speaker_id)
+    preset = args["--preset"]
+
+    # Load preset if specified
+    if preset is not None:
+        with open(preset) as f:
+            hparams.parse_json(f.read())
+    # Override hyper parameters
+    hparams.parse(args["--hparams"])
+    assert hparams.name == "wavenet_vocoder"
+
+    from train_student import build_model
+
+    # Model
+    model = build_model(name='student').to(device)
+
+    # Load checkpoint
+    print("Load checkpoint from {}".format(checkpoint_path))
+    if use_cuda:
+        checkpoint = torch.load(checkpoint_path)
+    else:
+        checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+    model.load_state_dict(checkpoint["state_dict"])
+
+    # Example inputs
+    if hparams.upsample_conditional_features:
+        c = torch.rand(1, hparams.cin_channels, example_frames).to(device)
+    else:
+        c = torch.rand(1, hparams.cin_channels, example_frames * audio.get_hop_size()).to(device)
+    g = None if speaker_id is None else torch.LongTensor([speaker_id]).to(device)
+
+    scripted = model.to_torchscript(c, g, log_scale_min=hparams.log_scale_min)
+
+    # Check traced module against eager mode
+    z = torch.randn(1, 1, c.size(-1) * model.upsample_factor).to(device)
+    with torch.no_grad():
+        y_eager = model(z, c=c, g=g, log_scale_min=hparams.log_scale_min)[0]
+        y_scripted = scripted(z, c) if g is None else scripted(z, c, g)
+    print("Max abs difference between eager and scripted: {}".format(
+        (y_eager - y_scripted).abs().max().item()))
+
+    scripted.save(dst_path)
+    print("Saved TorchScript module: {}".format(dst_path))
+    sys.exit(0)
@@ -99,6 +99,10 @@ hparams = tf.contrib.training.HParams(
 
     # Training:
     batch_size=2,
+    # If not None, training batches are built under a budget of padded audio
+    # samples (batch size x longest item, after max_time_steps crop) instead
+    # of a fixed batch_size. See TotalSamplesBatchSampler in train.py
+    batch_max_samples=None,
     adam_beta1=0.9,
     adam_beta2=0.999,
     adam_eps=1e-8,
@@ -129,6 +133,16 @@ hparams = tf.contrib.training.HParams(
 
     # Eval:
     share_upsample_conv=False,
+    # Distillation: compute teacher's local conditioning inputs of all layers
+    # in a single matmul out of autograd. Costs B x layers x gate_channels x T
+    # floats of memory per step.
+    precompute_teacher_conditioning=False,
+    # Distillation: compute STFT magnitudes of targets for the power loss in
+    # DataLoader workers
+    precompute_power_loss_target=False,
+    # Power loss: with torch>=1.0, split the STFT at 3 kHz instead of slicing
+    # frames (see power_magnitudes in train_student.py). Changes the loss scale.
+    power_loss_split_by_frequency=False,
     # Student
     iaf_layers=[10, 10, 10, 10, 10, 10],
     iaf_stacks=[1, 1, 1, 1, 1, 1],
@@ -14,6 +14,10 @@ options:
     --max-abs-value=<N>               Max abs value [default: -1].
     --file-name-suffix=<s>            File name suffix [default: ].
     --speaker-id=<id>                 Speaker ID (for multi-speaker model).
+    --fuse                            Fused residual blocks for incremental generation.
+    --quantize                        Dynamic int8 quantization (CPU inference only).
+    --stream                          Write blocks to the WAV file as soon as they are generated.
+    --block-size=<N>                  Samples per block in stream mode [default: 4000].
     --output-html                     Output html for blog post.
     -h, --help               Show help message.
 """
@@ -30,6 +34,7 @@ from tqdm import tqdm
 import librosa
 
 from wavenet_vocoder.util import is_mulaw_quantize, is_mulaw, is_raw
+from utils.stream import WavStreamWriter
 
 import audio
 from hparams import hparams
@@ -52,22 +57,12 @@ def _to_numpy(x):
     return x.numpy()
 
 
-def wavegen(model, length=None, c=None, g=None, initial_value=None,
-            fast=False, tqdm=tqdm):
-    """Generate waveform samples by WaveNet.
-
-    Args:
-        model (nn.Module) : WaveNet decoder
-        length (int): Time steps to generate. If conditinlal features are given,
-          then this is determined by the feature size.
-        c (numpy.ndarray): Conditional features, of shape T x C
-        g (scaler): Speaker ID
-        initial_value (int) : initial_value for the WaveNet decoder.
-        fast (Bool): Whether to remove weight normalization or not.
-        tqdm (lambda): tqdm
+def _prepare_inputs(model, length=None, c=None, g=None, initial_value=None, fast=False,
+                    cache=None):
+    """Sanity check and convert inputs of ``wavegen`` to tensors on device
 
     Returns:
-        numpy.ndarray : Generated waveform samples
+        tuple: (initial_input, c, g, length)
     """
     from train import sanity_check
     sanity_check(model, c, g)
@@ -120,12 +115,14 @@ def wavegen(model, length=None, c=None, g=None, initial_value=None,
     initial_input = initial_input.to(device)
     g = None if g is None else g.to(device)
     c = None if c is None else c.to(device)
-
     with torch.no_grad():
-        y_hat = model.incremental_forward(
-            initial_input, c=c, g=g, T=length, tqdm=tqdm, softmax=True, quantize=True,
-            log_scale_min=hparams.log_scale_min)
+        c = model.prepare_conditional(c, cache)
+
+    return initial_input, c, g, length
+
 
+def _to_waveform(y_hat):
+    """Convert generated samples (B x C x T) to waveform (T,)"""
     if is_mulaw_quantize(hparams.input_type):
         y_hat = y_hat.max(1)[1].view(-1).long().cpu().data.numpy()
         y_hat = P.inv_mulaw_quantize(y_hat, hparams.quantize_channels)
@@ -133,10 +130,71 @@ def wavegen(model, length=None, c=None, g=None, initial_value=None,
         y_hat = P.inv_mulaw(y_hat.view(-1).cpu().data.numpy(), hparams.quantize_channels)
     else:
         y_hat = y_hat.view(-1).cpu().data.numpy()
-
     return y_hat
 
 
+def wavegen(model, length=None, c=None, g=None, initial_value=None,
+            fast=False, tqdm=tqdm, cache=None):
+    """Generate waveform samples by WaveNet.
+
+    Args:
+        model (nn.Module) : WaveNet decoder
+        length (int): Time steps to generate. If conditinlal features are given,
+          then this is determined by the feature size.
+        c (numpy.ndarray): Conditional features, of shape T x C
+        g (scaler): Speaker ID
+        initial_value (int) : initial_value for the WaveNet decoder.
+        fast (Bool): Whether to remove weight normalization or not.
+        tqdm (lambda): tqdm
+        cache (ConditioningCache): Optional cache of upsampled features, to
+          reuse them when the same features are vocoded repeatedly.
+
+    Returns:
+        numpy.ndarray : Generated waveform samples
+    """
+    initial_input, c, g, length = _prepare_inputs(model, length, c, g, initial_value, fast, cache)
+
+    with torch.no_grad():
+        y_hat = model.incremental_forward(
+            initial_input, c=c, g=g, T=length, tqdm=tqdm, softmax=True, quantize=True,
+            log_scale_min=hparams.log_scale_min)
+
+    return _to_waveform(y_hat)
+
+
+def iter_wavegen(model, length=None, c=None, g=None, initial_value=None,
+                 fast=False, tqdm=tqdm, block_size=4000, cache=None):
+    """Generate waveform samples by WaveNet, yielding blocks as they are ready.
+
+    Args are same as ``wavegen``, plus:
+        block_size (int): Number of samples per yielded block. The last block
+          may be shorter.
+        cache (ConditioningCache): Optional cache of upsampled features.
+
+    Yields:
+        numpy.ndarray : Generated waveform samples, of shape (block_size,)
+    """
+    initial_input, c, g, length = _prepare_inputs(model, length, c, g, initial_value, fast, cache)
+
+    steps = model.iter_incremental_forward(
+        initial_input, c=c, g=g, T=length, tqdm=tqdm, softmax=True, quantize=True,
+        log_scale_min=hparams.log_scale_min)
+    block = []
+    while True:
+        # Don't leak no_grad to the caller between blocks
+        with torch.no_grad():
+            output = next(steps, None)
+        if output is not None:
+            block.append(output)
+        if len(block) == block_size or (output is None and len(block) > 0):
+            # T x B x C -> B x C x T
+            y_hat = torch.stack(block).transpose(0, 1).transpose(1, 2)
+            block = []
+            yield _to_waveform(y_hat)
+        if output is None:
+            break
+
+
 if __name__ == "__main__":
     args = docopt(__doc__)
     print("Command line args:\n", args)
@@ -155,6 +213,10 @@ if __name__ == "__main__":
     output_html = args["--output-html"]
     speaker_id = args["--speaker-id"]
     speaker_id = None if speaker_id is None else int(speaker_id)
+    fuse = args["--fuse"]
+    quantize = args["--quantize"]
+    stream = args["--stream"]
+    block_size = int(args["--block-size"])
     preset = args["--preset"]
 
     # Load preset if specified
@@ -164,6 +226,9 @@ if __name__ == "__main__":
     # Override hyper parameters
     hparams.parse(args["--hparams"])
     assert hparams.name == "wavenet_vocoder"
+    if quantize:
+        # quantized kernels are CPU only
+        device = torch.device("cpu")
 
     # Load conditional features
     if conditional_path is not None:
@@ -193,6 +258,11 @@ if __name__ == "__main__":
     else:
         checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
     model.load_state_dict(checkpoint["state_dict"])
+    if fuse:
+        assert not quantize, "--fuse does not use quantized weights"
+        model.make_fused_()
+    if quantize:
+        model.quantize_()
     checkpoint_name = splitext(basename(checkpoint_path))[0]
 
     os.makedirs(dst_dir, exist_ok=True)
@@ -201,10 +271,16 @@ if __name__ == "__main__":
     dst_wav_path = join(os.path.join(dst_dir, checkpoint_name), "{}{}.wav".format(wav_id, file_name_suffix))
 
     # DO generate
-    waveform = wavegen(model, length, c=c, g=speaker_id, initial_value=initial_value, fast=True)
+    if stream:
+        with WavStreamWriter(dst_wav_path, hparams.sample_rate) as writer:
+            for block in iter_wavegen(model, length, c=c, g=speaker_id, initial_value=initial_value,
+                                      fast=True, block_size=block_size):
+                writer.write(block)
+    else:
+        waveform = wavegen(model, length, c=c, g=speaker_id, initial_value=initial_value, fast=True)
 
-    # save
-    librosa.output.write_wav(dst_wav_path, waveform, sr=hparams.sample_rate)
+        # save
+        librosa.output.write_wav(dst_wav_path, waveform, sr=hparams.sample_rate)
 
     print("Finished! Check out {} for generated audio samples.".format(dst_dir))
     sys.exit(0)
@@ -12,6 +12,12 @@ options:
     --max-abs-value=<N>               Max abs value [default: -1].
     --file-name-suffix=<s>            File name suffix [default: ].
     --speaker-id=<id>                 Speaker ID (for multi-speaker model).
+    --script                          Checkpoint is a TorchScript module saved by export_student.py.
+    --chunk-size=<N>                  Generate N samples per forward pass, 0 for whole utterance [default: 0].
+    --num-workers=<N>                 Number of threads generating chunks in parallel [default: 1].
+    --quantize                        Dynamic int8 quantization (CPU inference only).
+    --stream                          Write blocks to the WAV file as soon as they are generated.
+    --block-size=<N>                  Samples per block in stream mode [default: 4000].
     --output-html                     Output html for blog post.
     -h, --help               Show help message.
 """
@@ -20,6 +26,7 @@ from docopt import docopt
 import sys
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from os.path import dirname, join, basename, splitext
 import torch
 import numpy as np
@@ -29,6 +36,7 @@ from tqdm import tqdm
 import librosa
 
 from wavenet_vocoder.util import is_mulaw_quantize, is_mulaw, is_raw
+from utils.stream import WavStreamWriter
 
 import audio
 from hparams import hparams
@@ -51,25 +59,80 @@ def _to_numpy(x):
     return x.numpy()
 
 
-def wavegen(model, c=None, g=None):
-    """Generate waveform samples by WaveNet.
+def _is_scripted(model):
+    return isinstance(model, torch.jit.ScriptModule)
+
+
+def load_scripted_model(path):
+    """Load student exported by ``export_student.py``"""
+    return torch.jit.load(path, map_location=device)
+
+
+def _generate_chunks(model, z, c=None, g=None, chunk_size=0, num_workers=1):
+    """Generate waveform chunks in order
+
+    Windows from ``Student.chunk_windows`` are padded by the receptive field,
+    so the concatenated chunks are the same as the output of a single pass
+    while only one window (per worker) is held in memory at a time.
 
     Args:
-        model (nn.Module) : WaveNet decoder
-        c (numpy.ndarray): Conditional features, of shape T x C
-        g (scaler): Speaker ID
+        model (nn.Module) : Student
+        z (Tensor): Gaussian noise, shape (1 x 1 x T)
+        c (Tensor): Local conditioning features, shape (1 x C x T')
+        g (Tensor): Speaker ID
+        chunk_size (int): Samples per chunk. If <= 0, or if model is a
+          TorchScript module, whole utterance is generated at once.
+        num_workers (int): Number of threads generating chunks in parallel.
+
+    Yields:
+        Tensor: Generated waveform chunk, shape (1 x 1 x T_chunk)
+    """
+    def f(window):
+        # no_grad is thread local
+        with torch.no_grad():
+            if _is_scripted(model):
+                y_hat = model(z, c) if g is None else model(z, c, g)
+            elif window is None:
+                y_hat, _, _, _ = model(x=z, c=c, g=g, device=device, log_scale_min=hparams.log_scale_min)
+            else:
+                y_hat, _, _, _ = model.forward_window(
+                    z, c=c, g=g, window=window, device=device, log_scale_min=hparams.log_scale_min)
+            return y_hat
+
+    if chunk_size <= 0 or _is_scripted(model):
+        yield f(None)
+        return
+
+    windows = model.chunk_windows(z.size(-1), chunk_size)
+    if num_workers <= 1:
+        for window in windows:
+            yield f(window)
+        return
+
+    with ThreadPoolExecutor(max_workers=num_workers) as executor:
+        # Keep at most num_workers windows in flight to bound memory usage
+        for i in range(0, len(windows), num_workers):
+            for y_hat in executor.map(f, windows[i:i + num_workers]):
+                yield y_hat
+
+
+def _prepare_inputs(model, c=None, g=None, cache=None):
+    """Sanity check and convert inputs of ``wavegen`` to tensors on device
+
     Returns:
-        numpy.ndarray : Generated waveform samples
+        tuple: (z, c, g, length)
     """
-    from train import sanity_check
-    sanity_check(model, c, g)
+    # TorchScript modules are exported in inference mode already
+    if not _is_scripted(model):
+        from train import sanity_check
+        sanity_check(model, c, g)
+
+        model.eval()
+        model.make_generation_fast_()
 
     c = _to_numpy(c)
     g = _to_numpy(g)
 
-    model.eval()
-    model.make_generation_fast_()
-
     assert c is not None
     # (Tc, D)
     if c.ndim != 2:
@@ -97,18 +160,71 @@ def wavegen(model, c=None, g=None):
     z = z.to(device)
     g = None if g is None else g.to(device)
     c = None if c is None else c.to(device)
+    # Upsample here only if the result can be reused, to keep memory usage of
+    # chunked generation bounded
+    if cache is not None and not _is_scripted(model):
+        c = model.prepare_conditional(c, cache)
+
+    return z, c, g, length
+
+
+def wavegen(model, c=None, g=None, chunk_size=0, num_workers=1, cache=None):
+    """Generate waveform samples by WaveNet.
+
+    Args:
+        model (nn.Module) : WaveNet decoder
+        c (numpy.ndarray): Conditional features, of shape T x C
+        g (scaler): Speaker ID
+        chunk_size (int): Samples per forward pass. If <= 0, whole utterance
+          is generated at once.
+        num_workers (int): Number of threads generating chunks in parallel.
+        cache (ConditioningCache): Optional cache of upsampled features, to
+          reuse them when the same features are vocoded repeatedly.
+    Returns:
+        numpy.ndarray : Generated waveform samples
+    """
+    z, c, g, length = _prepare_inputs(model, c, g, cache)
 
-    with torch.no_grad():
-        start_time = time.time()
-        y_hat, _, _, _ = model(x=z, c=c, g=g, device=device, log_scale_min=hparams.log_scale_min)
-        duration = time.time() - start_time
-        print('Time Evaluation: Generation of {} audio samples took {:.3f} sec ({:.3f} samples/sec)'.format(
-            length, duration, length / duration))
-        y_hat = y_hat.view(-1).cpu().data.numpy()
+    start_time = time.time()
+    y_hat = np.concatenate([y.view(-1).cpu().data.numpy() for y in _generate_chunks(
+        model, z, c=c, g=g, chunk_size=chunk_size, num_workers=num_workers)])
+    duration = time.time() - start_time
+    print('Time Evaluation: Generation of {} audio samples took {:.3f} sec ({:.3f} samples/sec)'.format(
+        length, duration, length / duration))
 
     return y_hat
 
 
+def iter_wavegen(model, c=None, g=None, block_size=4000, chunk_size=None, num_workers=1,
+                 cache=None):
+    """Generate waveform samples by WaveNet, yielding blocks as they are ready.
+
+    Args:
+        model (nn.Module) : WaveNet decoder
+        c (numpy.ndarray): Conditional features, of shape T x C
+        g (scaler): Speaker ID
+        block_size (int): Number of samples per yielded block. The last block
+          may be shorter.
+        chunk_size (int): Samples per forward pass. Defaults to ``block_size``.
+        num_workers (int): Number of threads generating chunks in parallel.
+        cache (ConditioningCache): Optional cache of upsampled features.
+
+    Yields:
+        numpy.ndarray : Generated waveform samples, of shape (block_size,)
+    """
+    z, c, g, length = _prepare_inputs(model, c, g, cache)
+    chunk_size = block_size if chunk_size is None else chunk_size
+
+    buf = np.zeros(0, dtype=np.float32)
+    for y in _generate_chunks(model, z, c=c, g=g, chunk_size=chunk_size, num_workers=num_workers):
+        buf = np.concatenate([buf, y.view(-1).cpu().data.numpy()])
+        while len(buf) >= block_size:
+            yield buf[:block_size]
+            buf = buf[block_size:]
+    if len(buf) > 0:
+        yield buf
+
+
 if __name__ == "__main__":
     args = docopt(__doc__)
     print("Command line args:\n", args)
@@ -124,6 +240,12 @@ if __name__ == "__main__":
     output_html = args["--output-html"]
     speaker_id = args["--speaker-id"]
     speaker_id = None if speaker_id is None else int(speaker_id)
+    script = args["--script"]
+    chunk_size = int(args["--chunk-size"])
+    num_workers = int(args["--num-workers"])
+    quantize = args["--quantize"]
+    stream = args["--stream"]
+    block_size = int(args["--block-size"])
     preset = args["--preset"]
 
     # Load preset if specified
@@ -133,6 +255,9 @@ if __name__ == "__main__":
     # Override hyper parameters
     hparams.parse(args["--hparams"])
     assert hparams.name == "wavenet_vocoder"
+    if quantize:
+        # quantized kernels are CPU only
+        device = torch.device("cpu")
 
     # Load conditional features
     assert checkpoint_path is not None
@@ -148,18 +273,25 @@ if __name__ == "__main__":
 
     wav_id = conditional_path.split("/")[-1].split('.')[0].replace("mel", "syn_iaf")
 
-    from train_student import build_model
-
-    # Model
-    model = build_model(name='student').to(device)
-
-    # Load checkpoint
-    print("Load checkpoint from {}".format(checkpoint_path))
-    if use_cuda:
-        checkpoint = torch.load(checkpoint_path)
+    if script:
+        assert not quantize, "--quantize is not supported for TorchScript modules"
+        print("Load TorchScript module from {}".format(checkpoint_path))
+        model = load_scripted_model(checkpoint_path)
     else:
-        checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
-    model.load_state_dict(checkpoint["state_dict"])
+        from train_student import build_model
+
+        # Model
+        model = build_model(name='student').to(device)
+
+        # Load checkpoint
+        print("Load checkpoint from {}".format(checkpoint_path))
+        if use_cuda:
+            checkpoint = torch.load(checkpoint_path)
+        else:
+            checkpoint = torch.load(checkpoint_path, map_location=lambda storage, loc: storage)
+        model.load_state_dict(checkpoint["state_dict"])
+        if quantize:
+            model.quantize_()
     checkpoint_name = splitext(basename(checkpoint_path))[0]
 
     os.makedirs(dst_dir, exist_ok=True)
@@ -168,10 +300,17 @@ if __name__ == "__main__":
     dst_wav_path = join(os.path.join(dst_dir, checkpoint_name), "{}{}.wav".format(wav_id, file_name_suffix))
 
     # DO generate
-    waveform = wavegen(model, c=c, g=speaker_id)
+    if stream:
+        with WavStreamWriter(dst_wav_path, hparams.sample_rate) as writer:
+            for block in iter_wavegen(model, c=c, g=speaker_id, block_size=block_size,
+                                      chunk_size=chunk_size if chunk_size > 0 else None,
+                                      num_workers=num_workers):
+                writer.write(block)
+    else:
+        waveform = wavegen(model, c=c, g=speaker_id, chunk_size=chunk_size, num_workers=num_workers)
 
-    # save
-    librosa.output.write_wav(dst_wav_path, waveform, sr=hparams.sample_rate)
+        # save
+        librosa.output.write_wav(dst_wav_path, waveform, sr=hparams.sample_rate)
 
     print("Finished! Check out {} for generated audio samples.".format(dst_dir))
     sys.exit(0)
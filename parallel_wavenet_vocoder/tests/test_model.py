@@ -77,6 +77,17 @@ def test_wavenet():
     print(y.size())
 
 
+def test_wavenet_one_hot_indices():
+    model = build_compact_model()
+    model.eval()
+    indices = torch.from_numpy(np.random.randint(0, 256, size=(2, 100)))
+    x = torch.from_numpy(to_categorical(indices.numpy(), num_classes=256).astype(np.float32))
+    with torch.no_grad():
+        y = model(x.transpose(1, 2).contiguous())
+        y_indices = model(indices)
+    assert np.allclose(y.numpy(), y_indices.numpy(), atol=1e-5)
+
+
 def _test_data(sr=4000, N=3000, returns_power=False, mulaw=True):
     x, _ = librosa.load(example_audio_file(), sr=sr)
     x, _ = librosa.effects.trim(x, top_db=15)
@@ -181,6 +192,21 @@ def test_local_conditioning_correctness():
         warn("oops! must be a bug!")
 
 
+def test_prepare_conditional_layers():
+    model = build_compact_model(cin_channels=4, upsample_conditional_features=True,
+                                upsample_scales=[2, 2])
+    model.eval()
+    x = torch.zeros(2, 256, 400)
+    x[:, 0, :] = 1
+    c = torch.rand(2, 4, 100)
+    with torch.no_grad():
+        y = model(x, c=c)
+        c_layers = model.prepare_conditional_layers(c)
+        y_layers = model(x, c_layers=c_layers)
+    assert c_layers.size() == (2, len(model.conv_layers) * 32, 400)
+    assert np.allclose(y.numpy(), y_layers.numpy(), atol=1e-5)
+
+
 @attr("local_conditioning")
 def test_local_conditioning_upsample_correctness():
     # condition by power
@@ -413,3 +439,47 @@ def test_incremental_forward_correctness():
         librosa.output.write_wav("target.wav", x_org, sr=sr)
         librosa.output.write_wav("online.wav", y_online, sr=sr)
         librosa.output.write_wav("inference.wav", y_inference, sr=sr)
+
+
+def test_iter_incremental_forward():
+    model = build_compact_model()
+    model.eval()
+    x = torch.from_numpy(to_categorical(np.random.randint(0, 256, 100), 256).T)
+    x = x.float().unsqueeze(0).contiguous()
+
+    # Teacher forcing to make outputs deterministic
+    y_online = model.incremental_forward(test_inputs=x, T=None, softmax=True, quantize=False)
+    outputs = list(model.iter_incremental_forward(test_inputs=x, T=None, softmax=True, quantize=False))
+
+    assert len(outputs) == x.size(-1)
+    y_iter = torch.stack(outputs).transpose(0, 1).transpose(1, 2)
+    assert np.allclose(y_online.numpy(), y_iter.numpy())
+
+
+def test_fused_residual_block():
+    for bias in [True, False]:
+        _test_fused_residual_block(bias)
+
+
+def _test_fused_residual_block(bias):
+    layer = ResidualConv1dGLU(16, 32, kernel_size=3, skip_out_channels=8, dilation=2,
+                              cin_channels=4, gin_channels=2, bias=bias,
+                              weight_normalization=False)
+    layer.eval()
+    x = torch.randn(1, 20, 16)
+    c = torch.randn(1, 20, 4)
+    g = torch.randn(1, 20, 2)
+
+    def run():
+        layer.clear_buffer()
+        outputs = [layer.incremental_forward(x[:, t:t + 1], c[:, t:t + 1], g[:, t:t + 1])
+                   for t in range(x.size(1))]
+        return [torch.cat(o, dim=1) for o in zip(*outputs)]
+
+    with torch.no_grad():
+        y, s = run()
+        layer.make_fused_()
+        y_fused, s_fused = run()
+
+    assert np.allclose(y.numpy(), y_fused.numpy(), atol=1e-5)
+    assert np.allclose(s.numpy(), s_fused.numpy(), atol=1e-5)
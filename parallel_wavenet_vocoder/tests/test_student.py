@@ -0,0 +1,100 @@
+# coding: utf-8
+from __future__ import with_statement, print_function, absolute_import
+
+import torch
+import numpy as np
+from functools import partial
+
+from wavenet_vocoder import Student, ConditioningCache
+
+use_cuda = False
+device = torch.device("cuda" if use_cuda else "cpu")
+
+# For test
+build_compact_student = partial(Student, out_channels=2, iaf_layers=[4, 4], iaf_stacks=[2, 2],
+                                residual_channels=16, gate_channels=16, skip_out_channels=16,
+                                scalar_input=True, use_gaussian=True)
+
+
+def _test_data(T=2000, cin_channels=4, upsample_factor=4):
+    z = torch.randn(1, 1, T)
+    c = torch.rand(1, cin_channels, T // upsample_factor)
+    return z, c
+
+
+def test_chunk_windows():
+    model = build_compact_student(cin_channels=4, upsample_conditional_features=True,
+                                  upsample_scales=[2, 2])
+    windows = model.chunk_windows(1000, 300)
+    # covers all time steps without overlap
+    assert windows[0][1] == 0 and windows[-1][2] == 1000
+    for (_, _, e), (_, s, _) in zip(windows[:-1], windows[1:]):
+        assert e == s
+    for window_start, start, end in windows:
+        assert window_start % model.upsample_factor == 0
+        assert start - window_start >= min(start, model.receptive_field - 1)
+
+
+def test_chunked_forward_correctness():
+    z, c = _test_data()
+    model = build_compact_student(cin_channels=4, upsample_conditional_features=True,
+                                  upsample_scales=[2, 2]).to(device)
+    model.eval()
+
+    with torch.no_grad():
+        y_full, _, _, _ = model(z, c=c, device=device)
+        y_chunks = [model.forward_window(z, c=c, window=window, device=device)[0]
+                    for window in model.chunk_windows(z.size(-1), 300)]
+    y_chunked = torch.cat(y_chunks, dim=-1)
+
+    assert y_chunked.size() == y_full.size()
+    assert np.allclose(y_full.numpy(), y_chunked.numpy(), atol=1e-5)
+
+
+def test_torchscript_export():
+    z, c = _test_data()
+    model = build_compact_student(cin_channels=4, upsample_conditional_features=True,
+                                  upsample_scales=[2, 2]).to(device)
+    scripted = model.to_torchscript(c[:, :, :50])
+
+    with torch.no_grad():
+        y_eager, _, _, _ = model(z, c=c, device=device)
+        y_scripted = scripted(z, c)
+
+    assert y_scripted.size() == y_eager.size()
+    assert np.allclose(y_eager.numpy(), y_scripted.numpy(), atol=1e-5)
+
+
+def test_quantize():
+    z, c = _test_data()
+    model = build_compact_student(cin_channels=4, upsample_conditional_features=True,
+                                  upsample_scales=[2, 2]).to(device)
+    model.eval()
+    with torch.no_grad():
+        y_fp32, _, _, _ = model(z, c=c, device=device)
+        model.quantize_()
+        y_int8, _, _, _ = model(z, c=c, device=device)
+
+    assert y_int8.size() == y_fp32.size()
+    assert np.corrcoef(y_fp32.view(-1).numpy(), y_int8.view(-1).numpy())[0, 1] > 0.9
+
+
+def test_prepare_conditional_cache():
+    z, c = _test_data()
+    model = build_compact_student(cin_channels=4, upsample_conditional_features=True,
+                                  upsample_scales=[2, 2]).to(device)
+    model.eval()
+    cache = ConditioningCache(max_entries=1)
+
+    with torch.no_grad():
+        y, _, _, _ = model(z, c=c, device=device)
+        c_up = model.prepare_conditional(c, cache)
+        assert c_up.size(-1) == z.size(-1)
+        assert model.prepare_conditional(c, cache) is c_up
+        y_prepared, _, _, _ = model(z, c=c_up, device=device)
+        y_window, _, _, _ = model.forward_window(
+            z, c=c_up, window=model.chunk_windows(z.size(-1), 300)[-1], device=device)
+
+    assert cache.hits == 1 and cache.misses == 1
+    assert np.allclose(y.numpy(), y_prepared.numpy(), atol=1e-5)
+    assert np.allclose(y[..., -y_window.size(-1):].numpy(), y_window.numpy(), atol=1e-5)
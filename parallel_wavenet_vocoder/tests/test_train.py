@@ -0,0 +1,50 @@
+# coding: utf-8
+from __future__ import with_statement, print_function, absolute_import
+
+import numpy as np
+import pytest
+
+import train
+import train_student
+
+
+def _padded_size(lengths, batch):
+    return lengths[batch].max() * len(batch)
+
+
+@pytest.mark.parametrize("module", [train, train_student])
+@pytest.mark.parametrize("batch_multiple", [1, 2, 4])
+def test_total_samples_batch_sampler(module, batch_multiple):
+    np.random.seed(1234)
+    lengths = np.random.randint(100, 20000, size=500)
+    max_samples, max_time_steps = 16000, 6000
+    sampler = module.TotalSamplesBatchSampler(
+        lengths, max_samples, max_time_steps=max_time_steps, batch_multiple=batch_multiple)
+    cropped = np.minimum(lengths, max_time_steps)
+
+    for epoch in range(2):
+        num_batches = len(sampler)
+        batches = list(sampler)
+        assert len(batches) == num_batches
+        assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+        for batch in batches:
+            assert _padded_size(cropped, batch) <= max_samples
+
+
+def test_total_samples_batch_sampler_multiple():
+    # 7 items fit the budget, batches are closed at 6
+    sampler = train.TotalSamplesBatchSampler(
+        np.full(20, 1000), 7000, batch_multiple=2, permutate=False)
+    assert [len(batch) for batch in sampler] == [6, 6, 6, 2]
+
+
+@pytest.mark.parametrize("batch_multiple", [1, 2])
+def test_total_samples_batch_sampler_over_budget(batch_multiple):
+    lengths = np.array([100, 200, 50000, 300, 400, 60000, 500])
+    sampler = train.TotalSamplesBatchSampler(
+        lengths, 1000, batch_multiple=batch_multiple, permutate=False)
+    batches = list(sampler)
+    assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+    for batch in batches:
+        if _padded_size(lengths, batch) > 1000:
+            assert len(batch) == 1 and lengths[batch[0]] > 1000
@@ -0,0 +1,57 @@
+# coding: utf-8
+from __future__ import with_statement, print_function, absolute_import
+
+import torch
+import numpy as np
+
+from train_student import power_magnitudes, PowerLoss
+
+
+def _old_power_loss(student_hat, y, sample_rate):
+    # PowerLoss.forward before the STFTs were shared (torch>=1.0 path)
+    def get_magnitude(stft_res):
+        real = stft_res[:, :, :, 0]
+        im = stft_res[:, :, :, 1]
+        return torch.sqrt(torch.pow(real, 2) + torch.pow(im, 2))
+
+    batch_size = student_hat.size(0)
+    student_hat = student_hat.view(batch_size, -1)
+    y = y.view(batch_size, -1)
+    window = torch.hann_window(1200, periodic=True)
+    freq = int(3000 / (sample_rate * 0.5) * 1025)
+    student_stft = torch.stft(student_hat, win_length=1200, hop_length=300, n_fft=2048, window=window)[:, :, :freq, :]
+    y_stft = torch.stft(y, win_length=1200, hop_length=300, n_fft=2048, window=window)[:, :, :freq, :]
+    loss = torch.pow(torch.norm(torch.abs(get_magnitude(student_stft)) - torch.abs(get_magnitude(y_stft)), p=2, dim=1), 2)
+
+    freq1 = int(3000 / (sample_rate * 0.5) * 257)
+    student_stft1 = torch.stft(student_hat, win_length=1200, hop_length=300, n_fft=2048, window=window)[:, :, freq1:, :]
+    y_stft1 = torch.stft(y, win_length=1200, hop_length=300, n_fft=2048, window=window)[:, :, freq1:, :]
+    loss1 = torch.pow(torch.norm(torch.abs(get_magnitude(student_stft1)) - torch.abs(get_magnitude(y_stft1)), p=2, dim=1), 2)
+
+    return torch.mean(loss, dim=1) + 10 * torch.mean(loss1, dim=1)
+
+
+def test_power_loss_matches_old_loss():
+    if torch.__version__ < '1.0':
+        return
+    sample_rate = 22050
+    student_hat = torch.randn(2, 1, 60000)
+    y = torch.randn(2, 60000, 1)
+    criterion = PowerLoss(torch.device("cpu"), sample_rate)
+
+    expected = _old_power_loss(student_hat, y, sample_rate)
+    assert np.allclose(criterion(student_hat, y).numpy(), expected.numpy(), rtol=1e-5)
+    y_magnitudes = power_magnitudes(y.view(2, -1), sample_rate)
+    assert np.allclose(criterion(student_hat, y, y_magnitudes).numpy(), expected.numpy(), rtol=1e-5)
+
+
+def test_power_magnitudes_split_by_frequency():
+    if torch.__version__ < '1.0':
+        return
+    sample_rate = 22050
+    x = torch.randn(2, 60000)
+    low, high = power_magnitudes(x, sample_rate, split_by_frequency=True)
+    freq = int(3000 / (sample_rate * 0.5) * 1025)
+    assert low.size(0) == 2 and low.size(2) == freq
+    assert low.size(2) + high.size(2) == 1025
+    assert low.size(1) == high.size(1)
@@ -22,7 +22,9 @@ import os
 from os.path import dirname, join, expanduser
 from tqdm import tqdm  # , trange
 from datetime import datetime
+from collections import Counter
 import random
+import time
 
 import numpy as np
 
@@ -85,22 +87,13 @@ def sanity_check(model, c, g):
             raise RuntimeError("WaveNet expects no conditional features, but given")
 
 
-def _pad(seq, max_len, constant_values=0):
-    return np.pad(seq, (0, max_len - len(seq)),
-                  mode='constant', constant_values=constant_values)
-
-
-def _pad_2d(x, max_len, b_pad=0):
-    x = np.pad(x, [(b_pad, max_len - len(x) - b_pad), (0, 0)],
-               mode="constant", constant_values=0)
-    return x
-
-
 class _NPYDataSource(FileDataSource):
     def __init__(self, data_root, col, speaker_id=None,
-                 train=True, test_size=0.05, test_num_samples=None, random_state=1234):
+                 train=True, test_size=0.05, test_num_samples=None, random_state=1234,
+                 mmap_mode="r"):
         self.data_root = data_root
         self.col = col
+        self.mmap_mode = mmap_mode
         self.lengths = []
         self.speaker_id = speaker_id
         self.multi_speaker = False
@@ -168,7 +161,8 @@ class _NPYDataSource(FileDataSource):
         return paths
 
     def collect_features(self, path):
-        return np.load(path)
+        # Memory-mapped, so that cropping reads only the needed window
+        return np.load(path, mmap_mode=self.mmap_mode)
 
 
 class RawAudioDataSource(_NPYDataSource):
@@ -229,10 +223,102 @@ class PartialyRandomizedSimilarTimeLengthSampler(Sampler):
         return len(self.sorted_indices)
 
 
+class TotalSamplesBatchSampler(Sampler):
+    """Batch sampler with a budget of total audio samples per batch
+
+    Same sort-then-local-shuffle as ``PartialyRandomizedSimilarTimeLengthSampler``,
+    but consecutive utterances are packed into a batch while the padded batch
+    size (number of items x longest item, after cropping to
+    ``max_time_steps``) fits in ``max_samples``. Batches are then permutated.
+
+    Args:
+        lengths (list): Number of audio samples of each utterance.
+        max_samples (int): Budget of padded audio samples per batch.
+        max_time_steps (int): Crop length applied by the data pipeline, if any.
+        batch_group_size (int): Number of utterances shuffled together.
+        batch_multiple (int): Batches are closed at a multiple of this (e.g.
+          number of GPUs for data parallel) when possible within the budget.
+          Batches where fewer than ``batch_multiple`` items fit and the last
+          batch may be smaller. Only a single item longer than the budget
+          forms an over-budget batch.
+        permutate (bool): Whether to permutate batches.
+    """
+
+    def __init__(self, lengths, max_samples, max_time_steps=None, batch_group_size=None,
+                 batch_multiple=1, permutate=True):
+        lengths = np.asarray(lengths)
+        if max_time_steps is not None:
+            lengths = np.minimum(lengths, max_time_steps)
+        self.lengths = lengths
+        self.sorted_indices = np.argsort(lengths, kind="mergesort")
+        self.max_samples = max_samples
+        self.batch_multiple = batch_multiple
+        if batch_group_size is None:
+            batch_size = max(1, max_samples // max(1, int(lengths.max())))
+            batch_group_size = min(batch_size * 32, len(lengths))
+        self.batch_group_size = batch_group_size
+        self.permutate = permutate
+        # Packing depends on the shuffle, so the next epoch's batches are
+        # prepared in advance for __len__ to be exact
+        self._batches = self._shuffled_batches()
+
+    def _padded_size(self, batch):
+        return int(self.lengths[batch].max()) * len(batch)
+
+    def _make_batches(self, indices):
+        batches = []
+        batch = []
+        for idx in indices:
+            batch.append(int(idx))
+            while len(batch) > 1 and self._padded_size(batch) > self.max_samples:
+                # Close at the largest multiple that fits, items over it and
+                # the new one start the next batch
+                full, pending = batch[:-1], batch[-1]
+                n = len(full) - len(full) % self.batch_multiple
+                if n == 0:
+                    n = len(full)
+                batches.append(full[:n])
+                batch = full[n:] + [pending]
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def _shuffled_batches(self):
+        indices = self.sorted_indices.copy()
+        for s in range(0, len(indices), self.batch_group_size):
+            np.random.shuffle(indices[s:s + self.batch_group_size])
+        batches = self._make_batches(indices)
+        if self.permutate:
+            random.shuffle(batches)
+        return batches
+
+    def __iter__(self):
+        try:
+            for batch in self._batches:
+                yield batch
+        finally:
+            self._batches = self._shuffled_batches()
+
+    def __len__(self):
+        return len(self._batches)
+
+
 class PyTorchDataset(object):
-    def __init__(self, X, Mel):
+    """(x, c, g) dataset
+
+    Args:
+        X (FileSourceDataset): Raw audio.
+        Mel (FileSourceDataset): Local conditioning features, or None.
+        max_time_steps (int): If not None, items are randomly cropped to at most
+          ``max_time_steps`` samples (frame aligned) when local conditioning
+          features are upsampled by the network. Otherwise cropping is left to
+          ``collate_fn``.
+    """
+
+    def __init__(self, X, Mel, max_time_steps=None):
         self.X = X
         self.Mel = Mel
+        self.max_time_steps = max_time_steps
         # alias
         self.multi_speaker = X.file_data_source.multi_speaker
 
@@ -243,6 +329,13 @@ class PyTorchDataset(object):
             mel = self.Mel[idx]
 
         raw_audio = self.X[idx]
+        if self.max_time_steps is not None and mel is not None and \
+                hparams.upsample_conditional_features:
+            raw_audio, mel = random_crop(raw_audio, mel, self.max_time_steps)
+        # Read (cropped) memory-mapped arrays
+        raw_audio = np.array(raw_audio)
+        mel = None if mel is None else np.array(mel)
+
         if self.multi_speaker:
             speaker_id = self.X.file_data_source.speaker_ids[idx]
         else:
@@ -374,6 +467,51 @@ def assert_ready_for_upsampling(x, c):
     assert len(x) % len(c) == 0 and len(x) // len(c) == audio.get_hop_size()
 
 
+def get_max_time_steps():
+    if hparams.max_time_sec is not None:
+        return int(hparams.max_time_sec * hparams.sample_rate)
+    return hparams.max_time_steps
+
+
+def random_crop(x, c, max_time_steps):
+    """Randomly crop audio and (not upsampled) features to the same time span
+
+    Args:
+        x (ndarray): Audio, shape (T,)
+        c (ndarray): Local conditioning features, shape (T / hop_size, D)
+        max_time_steps (int): Maximum audio samples. Rounded down to a multiple
+          of hop size.
+
+    Returns:
+        tuple: Cropped (x, c)
+    """
+    assert_ready_for_upsampling(x, c)
+    max_steps = ensure_divisible(max_time_steps, audio.get_hop_size(), True)
+    if len(x) > max_steps:
+        max_time_frames = max_steps // audio.get_hop_size()
+        s = np.random.randint(0, len(c) - max_time_frames)
+        ts = s * audio.get_hop_size()
+        x = x[ts:ts + audio.get_hop_size() * max_time_frames]
+        c = c[s:s + max_time_frames, :]
+        assert_ready_for_upsampling(x, c)
+    return x, c
+
+
+def _pin_batch_memory():
+    # Pinned memory can't be allocated in DataLoader worker processes, where
+    # the DataLoader pins batches itself if requested
+    if not (hparams.pin_memory and use_cuda):
+        return False
+    get_worker_info = getattr(data_utils, "get_worker_info", None)
+    return get_worker_info is not None and get_worker_info() is None
+
+
+def _zeros(size, dtype, pin=False):
+    if pin:
+        return torch.zeros(size, dtype=dtype, pin_memory=True)
+    return torch.zeros(size, dtype=dtype)
+
+
 def collate_fn(batch):
     """Create batch
 
@@ -384,19 +522,15 @@ def collate_fn(batch):
             - x[2] (ndarray,int) : list of (1,), speaker id
     Returns:
         tuple: Tuple of batch
-            - x (FloatTensor) : Network inputs (B, C, T)
+            - x (FloatTensor) : Network inputs (B, C, T), or quantized
+              indices (LongTensor) of shape (B, T) for mulaw-quantize input
             - y (LongTensor)  : Network targets (B, T, 1)
     """
 
     local_conditioning = len(batch[0]) >= 2 and hparams.cin_channels > 0
     global_conditioning = len(batch[0]) >= 3 and hparams.gin_channels > 0
 
-    if hparams.max_time_sec is not None:
-        max_time_steps = int(hparams.max_time_sec * hparams.sample_rate)
-    elif hparams.max_time_steps is not None:
-        max_time_steps = hparams.max_time_steps
-    else:
-        max_time_steps = None
+    max_time_steps = get_max_time_steps()
 
     # Time resolution adjustment
     if local_conditioning:
@@ -405,15 +539,9 @@ def collate_fn(batch):
             x, c, g = batch[idx]
             if hparams.upsample_conditional_features:
                 assert_ready_for_upsampling(x, c)
+                # no-op if already cropped by PyTorchDataset
                 if max_time_steps is not None:
-                    max_steps = ensure_divisible(max_time_steps, audio.get_hop_size(), True)
-                    if len(x) > max_steps:
-                        max_time_frames = max_steps // audio.get_hop_size()
-                        s = np.random.randint(0, len(c) - max_time_frames)
-                        ts = s * audio.get_hop_size()
-                        x = x[ts:ts + audio.get_hop_size() * max_time_frames]
-                        c = c[s:s + max_time_frames, :]
-                        assert_ready_for_upsampling(x, c)
+                    x, c = random_crop(x, c, max_time_steps)
             else:
                 x, c = audio.adjust_time_resolution(x, c)
                 if max_time_steps is not None and len(x) > max_time_steps:
@@ -439,48 +567,38 @@ def collate_fn(batch):
     # Lengths
     input_lengths = [len(x[0]) for x in batch]
     max_input_len = max(input_lengths)
+    B = len(batch)
 
-    # (B, T, C)
-    # pad for time-axis
-    if is_mulaw_quantize(hparams.input_type):
-        x_batch = np.array([_pad_2d(np_utils.to_categorical(
-            x[0], num_classes=hparams.quantize_channels),
-            max_input_len) for x in batch], dtype=np.float32)
-    else:
-        x_batch = np.array([_pad_2d(x[0].reshape(-1, 1), max_input_len)
-                            for x in batch], dtype=np.float32)
-    assert len(x_batch.shape) == 3
-
-    # (B, T)
+    # Preallocate batch tensors and copy items into them, to avoid per item
+    # padded copies and a transposed copy of the whole batch
+    pin = _pin_batch_memory()
     if is_mulaw_quantize(hparams.input_type):
-        y_batch = np.array([_pad(x[0], max_input_len) for x in batch], dtype=np.int)
+        # (B, T) indices, one-hot encoded on the model side (see WaveNet.forward)
+        x_batch = _zeros((B, max_input_len), torch.long, pin)
+        y_batch = _zeros((B, max_input_len, 1), torch.long, pin)
     else:
-        y_batch = np.array([_pad(x[0], max_input_len) for x in batch], dtype=np.float32)
-    assert len(y_batch.shape) == 2
-
-    # (B, T, D)
+        # (B, C, T)
+        x_batch = _zeros((B, 1, max_input_len), torch.float32, pin)
+        y_batch = _zeros((B, max_input_len, 1), torch.float32, pin)
     if local_conditioning:
         max_len = max([len(x[1]) for x in batch])
-        c_batch = np.array([_pad_2d(x[1], max_len) for x in batch], dtype=np.float32)
-        assert len(c_batch.shape) == 3
         # (B x C x T)
-        c_batch = torch.FloatTensor(c_batch).transpose(1, 2).contiguous()
+        c_batch = _zeros((B, batch[0][1].shape[-1], max_len), torch.float32, pin)
     else:
         c_batch = None
 
+    for idx, (x, c, g) in enumerate(batch):
+        x = torch.from_numpy(np.asarray(x))
+        x_batch[idx, ..., :len(x)] = x
+        y_batch[idx, :len(x), 0] = x
+        if local_conditioning:
+            c_batch[idx, :, :len(c)] = torch.from_numpy(np.asarray(c)).t()
+
     if global_conditioning:
         g_batch = torch.LongTensor([x[2] for x in batch])
     else:
         g_batch = None
 
-    # Covnert to channel first i.e., (B, C, T)
-    x_batch = torch.FloatTensor(x_batch).transpose(1, 2).contiguous()
-    # Add extra axis
-    if is_mulaw_quantize(hparams.input_type):
-        y_batch = torch.LongTensor(y_batch).unsqueeze(-1).contiguous()
-    else:
-        y_batch = torch.FloatTensor(y_batch).unsqueeze(-1).contiguous()
-
     input_lengths = torch.LongTensor(input_lengths)
 
     return x_batch, y_batch, c_batch, g_batch, input_lengths
@@ -630,7 +748,7 @@ def __train_step(device, phase, epoch, global_step, global_test_step,
                  checkpoint_dir, eval_dir=None, do_eval=False, ema=None):
     sanity_check(model, c, g)
 
-    # x : (B, C, T)
+    # x : (B, C, T), or (B, T) indices for mulaw-quantize
     # y : (B, T, 1)
     # c : (B, C, T)
     # g : (B,)
@@ -888,54 +1006,78 @@ def restore_parts(path, model):
                 warn("{}: may contain invalid size of weight. skipping...".format(k))
 
 
-def get_data_loaders(data_root, speaker_id, test_shuffle=True):
+def get_data_loaders(data_root, speaker_id, test_shuffle=True, mmap_mode="r"):
     data_loaders = {}
     local_conditioning = hparams.cin_channels > 0
     for phase in ["train", "test"]:
         train = phase == "train"
+        start_time = time.time()
         X = FileSourceDataset(RawAudioDataSource(data_root, speaker_id=speaker_id,
                                                  train=train,
                                                  test_size=hparams.test_size,
                                                  test_num_samples=hparams.test_num_samples,
-                                                 random_state=hparams.random_state))
+                                                 random_state=hparams.random_state,
+                                                 mmap_mode=mmap_mode))
+        timings = [("audio metadata", time.time() - start_time)]
         if local_conditioning:
+            start_time = time.time()
             Mel = FileSourceDataset(MelSpecDataSource(data_root, speaker_id=speaker_id,
                                                       train=train,
                                                       test_size=hparams.test_size,
                                                       test_num_samples=hparams.test_num_samples,
-                                                      random_state=hparams.random_state))
+                                                      random_state=hparams.random_state,
+                                                      mmap_mode=mmap_mode))
             assert len(X) == len(Mel)
             print("Local conditioning enabled. Shape of a sample: {}.".format(
                 Mel[0].shape))
+            timings.append(("mel metadata", time.time() - start_time))
         else:
             Mel = None
         print("[{}]: length of the dataset is {}".format(phase, len(X)))
 
+        start_time = time.time()
+        batch_sampler = None
         if train:
             lengths = np.array(X.file_data_source.lengths)
             # Prepare sampler
-            sampler = PartialyRandomizedSimilarTimeLengthSampler(
-                lengths, batch_size=hparams.batch_size)
+            if hparams.batch_max_samples is not None:
+                batch_multiple = torch.cuda.device_count() if use_cuda else 1
+                batch_sampler = TotalSamplesBatchSampler(
+                    lengths, hparams.batch_max_samples, max_time_steps=get_max_time_steps(),
+                    batch_multiple=batch_multiple)
+                sampler = None
+            else:
+                sampler = PartialyRandomizedSimilarTimeLengthSampler(
+                    lengths, batch_size=hparams.batch_size)
             shuffle = False
         else:
             sampler = None
             shuffle = test_shuffle
 
-        dataset = PyTorchDataset(X, Mel)
-        data_loader = data_utils.DataLoader(
-            dataset, batch_size=hparams.batch_size,
-            num_workers=hparams.num_workers, sampler=sampler, shuffle=shuffle,
-            collate_fn=collate_fn, pin_memory=hparams.pin_memory)
-
-        speaker_ids = {}
-        for idx, (x, c, g) in enumerate(dataset):
-            if g is not None:
-                try:
-                    speaker_ids[g] += 1
-                except KeyError:
-                    speaker_ids[g] = 1
-        if len(speaker_ids) > 0:
-            print("Speaker stats:", speaker_ids)
+        # Crop in __getitem__ for training, so only the needed window is read.
+        # Test set items are kept whole (e.g. for evaluate.py)
+        dataset = PyTorchDataset(X, Mel, get_max_time_steps() if train else None)
+        if batch_sampler is not None:
+            data_loader = data_utils.DataLoader(
+                dataset, batch_sampler=batch_sampler,
+                num_workers=hparams.num_workers,
+                collate_fn=collate_fn, pin_memory=hparams.pin_memory)
+        else:
+            data_loader = data_utils.DataLoader(
+                dataset, batch_size=hparams.batch_size,
+                num_workers=hparams.num_workers, sampler=sampler, shuffle=shuffle,
+                collate_fn=collate_fn, pin_memory=hparams.pin_memory)
+        timings.append(("sampler and loader", time.time() - start_time))
+
+        # From metadata, not to load every file
+        start_time = time.time()
+        if dataset.multi_speaker:
+            print("Speaker stats:", dict(Counter(X.file_data_source.speaker_ids)))
+        timings.append(("speaker stats", time.time() - start_time))
+
+        print("[{}]: data loader setup took {:.3f} sec ({})".format(
+            phase, sum(t for _, t in timings),
+            ", ".join("{}: {:.3f}".format(name, t) for name, t in timings)))
 
         data_loaders[phase] = data_loader
 
@@ -0,0 +1,65 @@
+# coding: utf-8
+from __future__ import with_statement, print_function, absolute_import
+
+import struct
+
+import numpy as np
+
+# RIFF/data size for streams of unknown length
+_UNKNOWN_SIZE = 0xFFFFFFFF
+
+
+class WavStreamWriter(object):
+    """Write 16-bit PCM blocks to a WAV file as soon as they are generated
+
+    For regular files the header is rewritten after every block, so the file
+    is always a valid WAV containing the samples written so far and playback
+    can start while it grows. For pipes (e.g. a FIFO made by ``mkfifo``), the
+    header sizes are set to 0xFFFFFFFF, which players treat as "until EOF".
+
+    Args:
+        path (str): Output path.
+        sample_rate (int): Sampling rate.
+    """
+
+    def __init__(self, path, sample_rate):
+        self.sample_rate = sample_rate
+        self.num_samples = 0
+        self._f = open(path, "wb")
+        self._seekable = self._f.seekable()
+        self._write_header()
+
+    def _write_header(self):
+        if self._seekable:
+            data_size = 2 * self.num_samples
+            riff_size = 36 + data_size
+        else:
+            data_size = riff_size = _UNKNOWN_SIZE
+        self._f.write(struct.pack(
+            "<4sI4s4sIHHIIHH4sI", b"RIFF", riff_size, b"WAVE",
+            b"fmt ", 16, 1, 1, self.sample_rate, self.sample_rate * 2, 2, 16,
+            b"data", data_size))
+
+    def write(self, wav):
+        """Append a block of samples
+
+        Args:
+            wav (numpy.ndarray): Waveform samples in [-1, 1].
+        """
+        pcm = (np.clip(wav, -1.0, 1.0) * 32767).astype("<i2")
+        self._f.write(pcm.tobytes())
+        self.num_samples += len(pcm)
+        if self._seekable:
+            self._f.seek(0)
+            self._write_header()
+            self._f.seek(0, 2)
+        self._f.flush()
+
+    def close(self):
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -5,3 +5,4 @@ from __future__ import with_statement, print_function, absolute_import
 
 from .wavenet import receptive_field_size, WaveNet
 from .student import Student
+from .cache import ConditioningCache
@@ -0,0 +1,72 @@
+# coding: utf-8
+from __future__ import with_statement, print_function, absolute_import
+
+import hashlib
+from collections import OrderedDict
+
+import torch
+
+
+def _tensor_digest(h, x):
+    x = x.detach().cpu().contiguous()
+    h.update(str((tuple(x.size()), x.dtype)).encode())
+    h.update(x.numpy().tobytes())
+
+
+class ConditioningCache(object):
+    """LRU cache of upsampled local conditioning features
+
+    Entries are keyed by a hash of the (not yet upsampled) features and of the
+    upsampler weights, so the cache can be shared between models, e.g. teacher
+    and student sharing the upsampler (``share_upsample_conv``), or several
+    checkpoints of the same model. Cached tensors are detached and must not be
+    modified in place.
+
+    Args:
+        max_entries (int): Maximum number of cached features.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def key(self, upsample_conv, c):
+        h = hashlib.sha1()
+        for name, param in sorted(upsample_conv.state_dict().items()):
+            h.update(name.encode())
+            _tensor_digest(h, param)
+        _tensor_digest(h, c)
+        h.update(str(c.device).encode())
+        return h.hexdigest()
+
+    def get(self, upsample_conv, c, compute):
+        """Return ``compute(c)`` from the cache, computing it on miss
+
+        Args:
+            upsample_conv (nn.ModuleList): Upsampling layers used by ``compute``.
+            c (Tensor): Local conditioning features, shape (B x C x T')
+            compute (callable): Upsampling function.
+
+        Returns:
+            Tensor: Upsampled features, shape (B x C x T)
+        """
+        key = self.key(upsample_conv, c)
+        if key in self._entries:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+        self.misses += 1
+        with torch.no_grad():
+            value = compute(c).detach()
+        self._entries[key] = value
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -12,8 +12,48 @@ class Conv1d(nn.Conv1d):
         super().__init__(*args, **kwargs)
         self.clear_buffer()
         self._linearized_weight = None
+        self.quantized_linear = None
         self.register_backward_hook(self._clear_linearized_weight)
 
+    def forward(self, input):
+        if self.quantized_linear is None:
+            return super().forward(input)
+        # input: (B, C, T)
+        kw = self.kernel_size[0]
+        dilation = self.dilation[0]
+        if self.padding[0] > 0:
+            input = F.pad(input, (self.padding[0], self.padding[0]))
+        if kw > 1:
+            # stack dilated taps along channels in the linearized weight order
+            T = input.size(-1) - dilation * (kw - 1)
+            input = torch.cat([input[:, :, k * dilation:k * dilation + T]
+                               for k in range(kw)], dim=1)
+        output = self.quantized_linear(input.transpose(1, 2).contiguous())
+        return output.transpose(1, 2)
+
+    def one_hot_forward(self, indices):
+        """Forward step for one-hot encoded input given by class indices
+
+        Same as ``forward`` on the one-hot encoded input, computed by an
+        embedding lookup of the weight. Only for 1x1 convolutions.
+
+        Args:
+            indices (LongTensor): Class indices, shape (B, T)
+
+        Returns:
+            Tensor: Output, shape (B, out_channels, T)
+        """
+        assert self.kernel_size[0] == 1
+        # run forward pre hooks (e.g., weight norm)
+        for hook in self._forward_pre_hooks.values():
+            hook(self, indices)
+        # (in_channels, out_channels)
+        weight = self.weight.view(self.out_channels, self.in_channels).t()
+        output = F.embedding(indices, weight)
+        if self.bias is not None:
+            output = output + self.bias
+        return output.transpose(1, 2)
+
     def incremental_forward(self, input):
         # input: (B, T, C)
         if self.training:
@@ -25,26 +65,59 @@ class Conv1d(nn.Conv1d):
 
         # reshape weight
         weight = self._get_linearized_weight()
-        kw = self.kernel_size[0]
-        dilation = self.dilation[0]
 
         bsz = input.size(0)  # input: bsz x len x dim
-        if kw > 1:
-            input = input.data
-            if self.input_buffer is None:
-                self.input_buffer = input.new(bsz, kw + (kw - 1) * (dilation - 1), input.size(2))
-                self.input_buffer.zero_()
-            else:
-                # shift buffer
-                self.input_buffer[:, :-1, :] = self.input_buffer[:, 1:, :].clone()
-            # append next input
-            self.input_buffer[:, -1, :] = input[:, -1, :]
-            input = self.input_buffer
-            if dilation > 1:
-                input = input[:, 0::dilation, :].contiguous()
-        output = F.linear(input.view(bsz, -1), weight, self.bias)
+        input = self.buffered_input(input)
+        if self.quantized_linear is not None:
+            output = self.quantized_linear(input.contiguous().view(bsz, -1))
+        else:
+            output = F.linear(input.view(bsz, -1), weight, self.bias)
         return output.view(bsz, 1, -1)
 
+    def buffered_input(self, input):
+        """Push the last time step of ``input`` (B, T, C) to the input buffer
+
+        Returns:
+            Tensor: Dilated taps seen by the kernel, shape (B, kw, C)
+        """
+        kw = self.kernel_size[0]
+        dilation = self.dilation[0]
+        if kw == 1:
+            return input
+        bsz = input.size(0)
+        input = input.data
+        if self.input_buffer is None:
+            self.input_buffer = input.new(bsz, kw + (kw - 1) * (dilation - 1), input.size(2))
+            self.input_buffer.zero_()
+        else:
+            # shift buffer
+            self.input_buffer[:, :-1, :] = self.input_buffer[:, 1:, :].clone()
+        # append next input
+        self.input_buffer[:, -1, :] = input[:, -1, :]
+        input = self.input_buffer
+        if dilation > 1:
+            input = input[:, 0::dilation, :].contiguous()
+        return input
+
+    def quantize_(self, dtype=torch.qint8):
+        """Replace the linearized weight by a dynamically quantized linear layer
+
+        Weights are quantized once, activations are quantized on the fly. Used
+        by both ``forward`` (stride 1 only) and ``incremental_forward``.
+        CPU inference only; weight normalization must be removed beforehand.
+        """
+        if hasattr(self, "weight_g"):
+            raise RuntimeError("remove weight normalization before quantization")
+        assert self.stride[0] == 1
+        self._linearized_weight = None
+        weight = self._get_linearized_weight().detach()
+        linear = nn.Linear(weight.size(1), weight.size(0), bias=self.bias is not None)
+        linear.weight.data.copy_(weight)
+        if self.bias is not None:
+            linear.bias.data.copy_(self.bias.data)
+        self.quantized_linear = torch.quantization.quantize_dynamic(
+            nn.Sequential(linear), {nn.Linear}, dtype=dtype)[0]
+
     def clear_buffer(self):
         self.input_buffer = None
 
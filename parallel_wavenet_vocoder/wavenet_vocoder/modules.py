@@ -58,6 +58,24 @@ def _conv1x1_forward(conv, x, is_incremental):
     return x
 
 
+def _bias(conv):
+    # Zeros for layers built with bias=False
+    if conv.bias is not None:
+        return conv.bias
+    return conv.weight.new_zeros(conv.out_channels)
+
+
+@torch.jit.script
+def _fused_gate(x, residual, weight, bias, skip_out_channels: int):
+    # tanh * sigmoid gate, then skip and output 1x1 convs as a single matmul.
+    # The output half of weight/bias is pre-scaled by sqrt(0.5).
+    a, b = x.chunk(2, dim=-1)
+    y = torch.addmm(bias, torch.tanh(a) * torch.sigmoid(b), weight.t())
+    s = y[:, :skip_out_channels]
+    x = y[:, skip_out_channels:] + residual * 0.7071067811865476
+    return x, s
+
+
 class ResidualConv1dGLU(nn.Module):
     """Residual dilated conv1d + Gated linear unit
 
@@ -127,14 +145,64 @@ class ResidualConv1dGLU(nn.Module):
                                      weight_normalization=weight_normalization)
         self.conv1x1_skip = Conv1d1x1(gate_out_channels, skip_out_channels, bias=bias,
                                       weight_normalization=weight_normalization)
+        self.fused = None
 
-    def forward(self, x, c=None, g=None):
-        return self._forward(x, c, g, False)
+    def forward(self, x, c=None, g=None, c_proj=None):
+        return self._forward(x, c, g, False, c_proj)
 
     def incremental_forward(self, x, c=None, g=None):
+        if self.fused is not None and (c is None) == (self.conv1x1c is None) \
+                and (g is None) == (self.conv1x1g is None):
+            return self._fused_incremental_forward(x, c, g)
         return self._forward(x, c, g, True)
 
-    def _forward(self, x, c, g, is_incremental):
+    def make_fused_(self):
+        """Precompute weights for the fused incremental (inference) path
+
+        The dilated conv and the conditioning 1x1 convs become one matmul over
+        the concatenated inputs with pre-merged biases, the gate and the
+        skip/output 1x1 convs another one. Weight normalization must be removed
+        beforehand; quantized weights (``quantize_``) are not used.
+        """
+        if self.training:
+            raise RuntimeError('fused path only supports eval mode')
+        convs = [f for f in [self.conv, self.conv1x1c, self.conv1x1g] if f is not None]
+        for f in convs + [self.conv1x1_skip, self.conv1x1_out]:
+            if hasattr(f, "weight_g"):
+                raise RuntimeError("remove weight normalization before fusing")
+            f._linearized_weight = None
+        with torch.no_grad():
+            in_weight = torch.cat([f._get_linearized_weight() for f in convs], dim=1)
+            in_bias = sum(_bias(f) for f in convs)
+            out_weight = torch.cat([self.conv1x1_skip._get_linearized_weight(),
+                                    self.conv1x1_out._get_linearized_weight() * math.sqrt(0.5)])
+            out_bias = torch.cat([_bias(self.conv1x1_skip), _bias(self.conv1x1_out) * math.sqrt(0.5)])
+        self.fused = (in_weight.contiguous(), in_bias.contiguous(),
+                      out_weight.contiguous(), out_bias.contiguous())
+
+    def _fused_incremental_forward(self, x, c, g):
+        """Fused version of ``_forward`` in incremental mode
+
+        Args:
+            x (Tensor): B x 1 x C
+            c (Tensor): B x 1 x C, Local conditioning features
+            g (Tensor): B x 1 x C, Expanded global conditioning features
+
+        Returns:
+            Tensor: output
+        """
+        in_weight, in_bias, out_weight, out_bias = self.fused
+        bsz = x.size(0)
+        inputs = [self.conv.buffered_input(x).contiguous().view(bsz, -1)]
+        for h in [c, g]:
+            if h is not None:
+                inputs.append(h.contiguous().view(bsz, -1))
+        h = torch.addmm(in_bias, torch.cat(inputs, dim=-1), in_weight.t())
+        x, s = _fused_gate(h, x.view(bsz, -1), out_weight, out_bias,
+                           self.conv1x1_skip.out_channels)
+        return x.view(bsz, 1, -1), s.view(bsz, 1, -1)
+
+    def _forward(self, x, c, g, is_incremental, c_proj=None):
         """Forward
 
         Args:
@@ -142,6 +210,8 @@ class ResidualConv1dGLU(nn.Module):
             c (Tensor): B x C x T, Local conditioning features
             g (Tensor): B x C x T, Expanded global conditioning features
             is_incremental (Bool) : Whether incremental mode or not
+            c_proj (Tensor): B x gate_channels x T, Local conditioning features
+              already projected by ``conv1x1c``. Used instead of ``c``.
 
         Returns:
             Tensor: output
@@ -160,9 +230,11 @@ class ResidualConv1dGLU(nn.Module):
         a, b = x.split(x.size(splitdim) // 2, dim=splitdim)
 
         # local conditioning
-        if c is not None:
-            assert self.conv1x1c is not None
-            c = _conv1x1_forward(self.conv1x1c, c, is_incremental)
+        if c is not None or c_proj is not None:
+            if c_proj is None:
+                assert self.conv1x1c is not None
+                c_proj = _conv1x1_forward(self.conv1x1c, c, is_incremental)
+            c = c_proj
             ca, cb = c.split(c.size(splitdim) // 2, dim=splitdim)
             a, b = a + ca, b + cb
 
@@ -8,6 +8,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
+from . import conv
 from .modules import Embedding
 
 from .modules import Conv1d1x1, ResidualConv1dGLU, ConvTranspose2d
@@ -180,6 +181,11 @@ class Student(nn.Module):
                 self.upsample_conv.append(nn.ReLU(inplace=True))
         else:
             self.upsample_conv = None
+        # samples per local conditioning frame
+        if upsample_conditional_features:
+            self.upsample_factor = int(np.prod(upsample_scales))
+        else:
+            self.upsample_factor = 1
 
         self.receptive_field = receptive_field_size(sum(iaf_layers), sum(iaf_stacks), kernel_size)
 
@@ -204,7 +210,8 @@ class Student(nn.Module):
               Also type of input tensor must be FloatTensor, not LongTensor
               in case of ``self.use_speaker_embedding`` equals False.
             softmax (bool): Whether applies softmax or not.
-            device: which device the tensor will be put
+            device: Not used, kept for backward compatibility. Outputs are on
+              the same device as ``x``.
 
         Returns:
             Tensor: output, shape B x out_channels x T
@@ -221,19 +228,16 @@ class Student(nn.Module):
         # Expand global conditioning features to all time steps
         g_bct = _expand_global_features(B, T, g, bct=True)
 
-        if c is not None and self.upsample_conv is not None:
-            # B x 1 x C x T
-            c = c.unsqueeze(1)
-            for f in self.upsample_conv:
-                c = f(c)
-            # B x C x T
-            c = c.squeeze(1)
+        # Skip upsampling if features are already prepared
+        if c is not None and c.size(-1) != T:
+            c = self.prepare_conditional(c)
             assert c.size(-1) == x.size(-1)
 
         # Feed data to network
-        mu_tot = torch.zeros((B, 1, T), requires_grad=True).to(device)
-        scale_tot = torch.ones((B, 1, T), requires_grad=True).to(device)
-        log_scale_tot = torch.zeros((B, 1, T), requires_grad=True).to(device)
+        # gradients flow through mu/scale of each flow, not the initial values
+        mu_tot = x.new_zeros((B, 1, T))
+        scale_tot = x.new_ones((B, 1, T))
+        log_scale_tot = x.new_zeros((B, 1, T))
 
         for each_iaf_layer in self.iaf_layers:
             # first conv
@@ -260,7 +264,7 @@ class Student(nn.Module):
 
             mu_tot = mu + mu_tot * scale
             scale_tot = scale_tot * scale
-            log_scale_tot += log_scale
+            log_scale_tot = log_scale_tot + log_scale
 
         log_scale_tot = torch.clamp(log_scale_tot, min=log_scale_min)
         scale_tot = torch.clamp(scale_tot, min=np.exp(log_scale_min))
@@ -272,6 +276,80 @@ class Student(nn.Module):
         x = torch.clamp(x, min=-1.0, max=1.0)
         return x, mu_tot, scale_tot, log_scale_tot
 
+    def chunk_windows(self, T, chunk_size):
+        """Split time steps into windows for chunked inference
+
+        Each window is extended to the left by the receptive field, so outputs
+        kept from it are identical to the ones of a single full pass. Window
+        bounds are aligned to ``upsample_factor`` so that local conditioning
+        features can be sliced per frame.
+
+        Args:
+            T (int): Number of time steps to generate.
+            chunk_size (int): Number of output time steps per window.
+
+        Returns:
+            list: List of (window_start, start, end) tuples. Outputs for
+              ``[start, end)`` are computed from inputs ``[window_start, end)``.
+        """
+        hop = self.upsample_factor
+        chunk_size = max(hop, chunk_size - chunk_size % hop)
+        context = self.receptive_field - 1
+        context += -context % hop
+        return [(max(0, start - context), start, min(start + chunk_size, T))
+                for start in range(0, T, chunk_size)]
+
+    def forward_window(self, x, c=None, g=None, window=None, device='cuda', log_scale_min=-7.0):
+        """Forward step restricted to a window returned by ``chunk_windows``
+
+        Args:
+            x (Tensor): Gaussian Noise of the whole utterance, shape (B x 1 x T)
+            c (Tensor): Local conditioning features of the whole utterance,
+              shape (B x cin_channels x T / upsample_factor), or (B x
+              cin_channels x T) if prepared by ``prepare_conditional``
+            g (Tensor): Global conditioning features, see ``forward``.
+            window (tuple): (window_start, start, end)
+            device: Not used, see ``forward``.
+
+        Returns:
+            tuple: Same as ``forward``, for time steps ``[start, end)`` only.
+        """
+        window_start, start, end = window
+        hop = self.upsample_factor if c is not None and c.size(-1) != x.size(-1) else 1
+        x = x[:, :, window_start:end]
+        if c is not None:
+            c = c[:, :, window_start // hop:end // hop]
+        outputs = self.forward(x, c=c, g=g, device=device, log_scale_min=log_scale_min)
+        return tuple(output[..., start - window_start:] for output in outputs)
+
+    def prepare_conditional(self, c, cache=None):
+        """Upsample local conditioning features to the sample resolution
+
+        Upsampled features can be passed to ``forward`` (and
+        ``incremental_forward``) in place of ``c`` to skip upsampling there.
+
+        Args:
+            c (Tensor): Local conditioning features, shape (B x cin_channels x T')
+            cache (ConditioningCache): Optional cache of upsampled features.
+
+        Returns:
+            Tensor: Upsampled features, shape (B x cin_channels x T). Same as
+              ``c`` if the model doesn't upsample conditioning features.
+        """
+        if c is None or self.upsample_conv is None:
+            return c
+        if cache is not None:
+            return cache.get(self.upsample_conv, c, self._upsample_conditional)
+        return self._upsample_conditional(c)
+
+    def _upsample_conditional(self, c):
+        # B x 1 x C x T
+        c = c.unsqueeze(1)
+        for f in self.upsample_conv:
+            c = f(c)
+        # B x C x T
+        return c.squeeze(1)
+
     def make_generation_fast_(self):
         def remove_weight_norm(m):
             try:
@@ -279,3 +357,52 @@ class Student(nn.Module):
             except ValueError:  # this module didn't have weight norm
                 return
         self.apply(remove_weight_norm)
+
+    def quantize_(self):
+        """Dynamic int8 quantization of all convolutions for CPU inference
+
+        Weight normalization is removed first. Upsampling layers and
+        embeddings stay in fp32.
+        """
+        self.eval()
+        self.make_generation_fast_()
+        for m in self.modules():
+            if isinstance(m, conv.Conv1d):
+                m.quantize_()
+
+    def to_torchscript(self, example_c, example_g=None, log_scale_min=-7.0):
+        """Export inference path as a traced TorchScript module
+
+        Weight normalization is removed (in place) before tracing. The traced
+        module takes ``(x, c)``, or ``(x, c, g)`` with global conditioning, and
+        returns the generated waveform only. Flow and layer loops are unrolled
+        by tracing, so any time length can be fed afterwards.
+
+        Args:
+            example_c (Tensor): Example local conditioning features, shape
+              (1 x cin_channels x T')
+            example_g (Tensor): Example global conditioning features.
+            log_scale_min (float): Log scale minimum value.
+
+        Returns:
+            torch.jit.ScriptModule: Traced module.
+        """
+        self.eval()
+        self.make_generation_fast_()
+        T = example_c.size(-1) * self.upsample_factor
+        example_x = example_c.new_zeros((1, 1, T)).normal_()
+        inputs = (example_x, example_c) if example_g is None else (example_x, example_c, example_g)
+        with torch.no_grad():
+            return torch.jit.trace(_StudentInference(self, log_scale_min), inputs)
+
+
+class _StudentInference(nn.Module):
+    """Inference-only view of Student, returning the waveform only"""
+
+    def __init__(self, student, log_scale_min):
+        super(_StudentInference, self).__init__()
+        self.student = student
+        self.log_scale_min = log_scale_min
+
+    def forward(self, x, c, g=None):
+        return self.student(x, c=c, g=g, log_scale_min=self.log_scale_min)[0]
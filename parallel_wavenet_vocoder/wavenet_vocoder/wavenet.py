@@ -8,6 +8,7 @@ import torch
 from torch import nn
 from torch.nn import functional as F
 
+from . import conv
 from .modules import Embedding
 
 from .modules import Conv1d1x1, ResidualConv1dGLU, ConvTranspose2d
@@ -179,11 +180,12 @@ class WaveNet(nn.Module):
     def local_conditioning_enabled(self):
         return self.cin_channels > 0
 
-    def forward(self, x, c=None, g=None, softmax=False):
+    def forward(self, x, c=None, g=None, softmax=False, c_layers=None):
         """Forward step
 
         Args:
-            x (Tensor): One-hot encoded audio signal, shape (B x C x T)
+            x (Tensor): One-hot encoded audio signal, shape (B x C x T), or
+              class indices (LongTensor) of shape (B x T) for non-scalar input
             c (Tensor): Local conditioning features,
               shape (B x cin_channels x T)
             g (Tensor): Global conditioning features,
@@ -194,11 +196,16 @@ class WaveNet(nn.Module):
               Also type of input tensor must be FloatTensor, not LongTensor
               in case of ``self.use_speaker_embedding`` equals False.
             softmax (bool): Whether applies softmax or not.
+            c_layers (Tensor): Local conditioning inputs of all layers from
+              ``prepare_conditional_layers``. Used instead of ``c``.
 
         Returns:
             Tensor: output, shape B x out_channels x T
         """
-        B, _, T = x.size()
+        if x.dim() == 2:
+            B, T = x.size()
+        else:
+            B, _, T = x.size()
 
         if g is not None:
             if self.embed_speakers is not None:
@@ -210,20 +217,25 @@ class WaveNet(nn.Module):
         # Expand global conditioning features to all time steps
         g_bct = _expand_global_features(B, T, g, bct=True)
 
-        if c is not None and self.upsample_conv is not None:
-            # B x 1 x C x T
-            c = c.unsqueeze(1)
-            for f in self.upsample_conv:
-                c = f(c)
-            # B x C x T
-            c = c.squeeze(1)
+        # Skip upsampling if features are already prepared
+        if c is not None and c.size(-1) != T:
+            c = self.prepare_conditional(c)
             assert c.size(-1) == x.size(-1)
 
         # Feed data to network
-        x = self.first_conv(x)
+        if x.dim() == 2:
+            # embedding lookup instead of dense one-hot
+            x = self.first_conv.one_hot_forward(x)
+        else:
+            x = self.first_conv(x)
+        if c_layers is not None:
+            c_layers = c_layers.split(c_layers.size(1) // len(self.conv_layers), dim=1)
         skips = None
-        for f in self.conv_layers:
-            x, h = f(x, c, g_bct)
+        for i, f in enumerate(self.conv_layers):
+            if c_layers is None:
+                x, h = f(x, c, g_bct)
+            else:
+                x, h = f(x, None, g_bct, c_layers[i])
             if skips is None:
                 skips = h
             else:
@@ -265,6 +277,28 @@ class WaveNet(nn.Module):
             Tensor: Generated one-hot encoded samples. B x C x T　
               or scaler vector B x 1 x T
         """
+        outputs = list(self.iter_incremental_forward(
+            initial_input, c=c, g=g, T=T, test_inputs=test_inputs, tqdm=tqdm,
+            softmax=softmax, quantize=quantize, log_scale_min=log_scale_min))
+        # T x B x C
+        outputs = torch.stack(outputs)
+        # B x C x T
+        outputs = outputs.transpose(0, 1).transpose(1, 2).contiguous()
+        return outputs
+
+    def iter_incremental_forward(self, initial_input=None, c=None, g=None,
+                                 T=100, test_inputs=None,
+                                 tqdm=lambda x: x, softmax=True, quantize=True,
+                                 log_scale_min=-7.0):
+        """Incremental forward step, yielding samples as they are generated
+
+        Same as ``incremental_forward``, but yields the output of each time step
+        instead of returning all of them stacked at the end.
+
+        Yields:
+            Tensor: Generated one-hot encoded sample of shape B x C, or scaler
+              of shape B x 1, for a single time step.
+        """
         self.clear_buffer()
         B = 1
 
@@ -296,18 +330,12 @@ class WaveNet(nn.Module):
         g_btc = _expand_global_features(B, T, g, bct=False)
 
         # Local conditioning
-        if c is not None and self.upsample_conv is not None:
-            # B x 1 x C x T
-            c = c.unsqueeze(1)
-            for f in self.upsample_conv:
-                c = f(c)
-            # B x C x T
-            c = c.squeeze(1)
+        if c is not None and c.size(-1) != T:
+            c = self.prepare_conditional(c)
             assert c.size(-1) == T
         if c is not None and c.size(-1) == T:
             c = c.transpose(1, 2).contiguous()
 
-        outputs = []
         if initial_input is None:
             if self.scalar_input:
                 initial_input = torch.zeros(B, 1, 1)
@@ -328,7 +356,7 @@ class WaveNet(nn.Module):
                 current_input = test_inputs[:, t, :].unsqueeze(1)
             else:
                 if t > 0:
-                    current_input = outputs[-1]
+                    current_input = output
 
             # Conditioning features for single time step
             ct = None if c is None else c[:, t, :].unsqueeze(1)
@@ -365,14 +393,10 @@ class WaveNet(nn.Module):
                         np.arange(self.out_channels), p=x.view(-1).data.cpu().numpy())
                     x.zero_()
                     x[:, sample] = 1.0
-            outputs += [x.data]
-        # T x B x C
-        outputs = torch.stack(outputs)
-        # B x C x T
-        outputs = outputs.transpose(0, 1).transpose(1, 2).contiguous()
+            output = x.data
+            yield output
 
         self.clear_buffer()
-        return outputs
 
     def clear_buffer(self):
         self.first_conv.clear_buffer()
@@ -384,6 +408,61 @@ class WaveNet(nn.Module):
             except AttributeError:
                 pass
 
+    def prepare_conditional(self, c, cache=None):
+        """Upsample local conditioning features to the sample resolution
+
+        Upsampled features can be passed to ``forward`` (and
+        ``incremental_forward``) in place of ``c`` to skip upsampling there.
+
+        Args:
+            c (Tensor): Local conditioning features, shape (B x cin_channels x T')
+            cache (ConditioningCache): Optional cache of upsampled features.
+
+        Returns:
+            Tensor: Upsampled features, shape (B x cin_channels x T). Same as
+              ``c`` if the model doesn't upsample conditioning features.
+        """
+        if c is None or self.upsample_conv is None:
+            return c
+        if cache is not None:
+            return cache.get(self.upsample_conv, c, self._upsample_conditional)
+        return self._upsample_conditional(c)
+
+    def prepare_conditional_layers(self, c, cache=None):
+        """Local conditioning inputs of all residual layers at once
+
+        Upsamples ``c`` if needed (see ``prepare_conditional``), then applies
+        ``conv1x1c`` of all layers as a single convolution. The result can be
+        passed as ``c_layers`` to ``forward`` in place of ``c``, e.g. to reuse
+        it for several forward passes with a frozen model.
+
+        Args:
+            c (Tensor): Local conditioning features, shape (B x cin_channels x T')
+              or already upsampled (B x cin_channels x T)
+            cache (ConditioningCache): Optional cache of upsampled features.
+
+        Returns:
+            Tensor: shape (B x layers * gate_channels x T)
+        """
+        c = self.prepare_conditional(c, cache)
+        weights, biases = [], []
+        for f in self.conv_layers:
+            m = f.conv1x1c
+            # run forward pre hooks (e.g., weight norm)
+            for hook in m._forward_pre_hooks.values():
+                hook(m, c)
+            weights.append(m.weight)
+            biases.append(m.bias)
+        return F.conv1d(c, torch.cat(weights), torch.cat(biases))
+
+    def _upsample_conditional(self, c):
+        # B x 1 x C x T
+        c = c.unsqueeze(1)
+        for f in self.upsample_conv:
+            c = f(c)
+        # B x C x T
+        return c.squeeze(1)
+
     def make_generation_fast_(self):
         def remove_weight_norm(m):
             try:
@@ -391,3 +470,25 @@ class WaveNet(nn.Module):
             except ValueError:  # this module didn't have weight norm
                 return
         self.apply(remove_weight_norm)
+
+    def make_fused_(self):
+        """Use fused residual blocks in ``incremental_forward`` (inference only)
+
+        Weight normalization is removed first.
+        """
+        self.eval()
+        self.make_generation_fast_()
+        for f in self.conv_layers:
+            f.make_fused_()
+
+    def quantize_(self):
+        """Dynamic int8 quantization of all convolutions for CPU inference
+
+        Weight normalization is removed first. Upsampling layers and
+        embeddings stay in fp32.
+        """
+        self.eval()
+        self.make_generation_fast_()
+        for m in self.modules():
+            if isinstance(m, conv.Conv1d):
+                m.quantize_()
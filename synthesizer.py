@@ -1,16 +1,47 @@
 import io
 import numpy as np
 import tensorflow as tf
+import time
 from hparams import hparams
 from librosa import effects
 from models import create_model
+from tensorflow.python.util import nest
 from text import text_to_sequence_zh
+from text.symbols import pinyin_symbols
 from util import audio
 
 from text.pinyinconvert import sentence_to_pinyin
 
+def add_session_arguments(parser):
+  '''Adds command line flags for the inference session configuration (see session_config).'''
+  parser.add_argument('--intra_op_threads', type=int, default=0,
+    help='Threads per op (0: number of cores). Lower it when several sessions share a host.')
+  parser.add_argument('--inter_op_threads', type=int, default=0,
+    help='Threads for running independent ops in parallel (0: number of cores).')
+  parser.add_argument('--graph_opt_level', type=int, default=1, choices=[0, 1],
+    help='Graph optimization level: 1 enables constant folding and common subexpression elimination.')
+  parser.add_argument('--xla', action='store_true', help='Compile the graph with the XLA JIT.')
+
+
+def session_config(intra_op_threads=0, inter_op_threads=0, graph_opt_level=1, xla=False):
+  '''Returns a ConfigProto for the inference session. 0 threads means TensorFlow's default.'''
+  config = tf.ConfigProto(intra_op_parallelism_threads=intra_op_threads,
+    inter_op_parallelism_threads=inter_op_threads)
+  optimizer_options = config.graph_options.optimizer_options
+  optimizer_options.opt_level = tf.OptimizerOptions.L1 if graph_opt_level else tf.OptimizerOptions.L0
+  if xla:
+    optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+  return config
+
+
+def session_config_from_args(args):
+  return session_config(args.intra_op_threads, args.inter_op_threads, args.graph_opt_level, args.xla)
+
+
 class Synthesizer:
-  def load(self, checkpoint_path, model_name='tacotron'):
+  def load(self, checkpoint_path, model_name='tacotron', config=None):
+    '''Builds the model and restores checkpoint_path. config is an optional tf.ConfigProto
+    (see session_config) for the session.'''
     print('Constructing model: %s' % model_name)
     inputs = tf.placeholder(tf.int32, [1, None], 'inputs')
     input_lengths = tf.placeholder(tf.int32, [1], 'input_lengths')
@@ -20,27 +51,121 @@ class Synthesizer:
       self.wav_output = audio.inv_spectrogram_tensorflow(self.model.linear_outputs[0])
 
     print('Loading checkpoint: %s' % checkpoint_path)
-    self.session = tf.Session()
+    self.session = tf.Session(config=config)
     self.session.run(tf.global_variables_initializer())
     saver = tf.train.Saver()
     saver.restore(self.session, checkpoint_path)
+    self._checkpoint_path = checkpoint_path
+    self._model_name = model_name
+    self._config = config
+    self._stream_model = None
 
 
-  def synthesize(self, text):
-    #print('synthesize:',text)
+  def _load_streaming(self):
+    # The step-wise model has its own graph, so its variable names match the checkpoint.
+    with tf.Graph().as_default():
+      inputs = tf.placeholder(tf.int32, [1, None], 'inputs')
+      input_lengths = tf.placeholder(tf.int32, [1], 'input_lengths')
+      with tf.variable_scope('model') as scope:
+        self._stream_model = create_model(self._model_name, hparams)
+        self._stream_model.initialize_streaming(inputs, input_lengths)
+      self._stream_session = tf.Session(config=self._config)
+      tf.train.Saver().restore(self._stream_session, self._checkpoint_path)
+
+
+  def _sequence(self, text):
     cleaner_names = [x.strip() for x in hparams.cleaners.split(',')]
+    return text_to_sequence_zh(text, cleaner_names)
+
+
+  def warmup(self, lengths=(10, 50, 150), seed=1234):
+    '''Synthesizes random sentences of the given lengths (in symbols) so that TF's lazy kernel
+    initialization, allocator growth and FFT setup happen before the first real request.
+
+    Returns the seconds spent on each length.
+    '''
+    rng = np.random.RandomState(seed)
+    durations = []
+    for n in lengths:
+      start = time.time()
+      self.synthesize(' '.join(rng.choice(pinyin_symbols[2:], n)))
+      durations.append(time.time() - start)
+    return durations
+
+
+  def iter_synthesize(self, text, chunk_steps=10, post_context=40):
+    '''Yields (mel, linear) spectrogram chunks, each [frames, channels], while decoding text.
+
+    The decoder runs chunk_steps steps per session run. The post-processing CBHG is run on each
+    new chunk of frames with post_context frames of context on both sides, so a chunk is only
+    yielded once post_context frames after it have been decoded (or decoding has finished).
+    Concatenating the chunks gives the same mel spectrogram as synthesize; the linear spectrogram
+    only differs slightly near chunk boundaries.
+    '''
+    if self._stream_model is None:
+      self._load_streaming()
+    model, session = self._stream_model, self._stream_session
+    seq = self._sequence(text)
+    feed_dict = {
+      model.inputs: [np.asarray(seq, dtype=np.int32)],
+      model.input_lengths: np.asarray([len(seq)], dtype=np.int32)
+    }
+    feed_dict[model.encoder_outputs] = session.run(model.encoder_outputs, feed_dict=feed_dict)
+
+    mels = np.zeros((0, hparams.num_mels), dtype=np.float32)
+    emitted = 0
+    steps = 0
+    finished = False
+    while not finished:
+      # Stop at the same step as synthesize (maximum_iterations=max_iters):
+      feed_dict[model.chunk_steps] = min(chunk_steps, hparams.max_iters - steps)
+      mel, state, finished = session.run(
+        [model.mel_outputs[0], model.final_decoder_state, model.finished], feed_dict=feed_dict)
+      steps += len(mel) // model.outputs_per_step
+      finished = finished or steps >= hparams.max_iters
+      feed_dict.update(zip(nest.flatten(model.decoder_state), nest.flatten(state)))
+      feed_dict[model.decoder_inputs] = mel[-1:]
+      mels = np.concatenate([mels, mel])
+
+      ready = len(mels) if finished else len(mels) - post_context
+      if ready > emitted:
+        start = max(0, emitted - post_context)
+        end = min(len(mels), ready + post_context)
+        linear = session.run(model.linear_outputs[0], feed_dict={model.post_inputs: [mels[start:end]]})
+        yield mels[emitted:ready], linear[emitted - start:ready - start]
+        emitted = ready
+
+
+  def synthesize(self, text, timings=None):
+    '''Returns the wav file bytes for text.
+
+    If timings is a dict, the seconds spent in each stage ("tokenize", "decoder" (the whole
+    Tacotron model), "griffin_lim" and "wav_encode") and the length of the output ("audio_seconds")
+    are stored in it.
+    '''
     #text=sentence_to_pinyin(text)
-    #print('text:',text)
-    #print('cleaner_names:',cleaner_names)
-    seq = text_to_sequence_zh(text, cleaner_names)
-    print(seq)
+    start = time.time()
+    seq = self._sequence(text)
+    tokenized = time.time()
     feed_dict = {
       self.model.inputs: [np.asarray(seq, dtype=np.int32)],
       self.model.input_lengths: np.asarray([len(seq)], dtype=np.int32)
     }
-    wav = self.session.run(self.wav_output, feed_dict=feed_dict)
+    # Run Griffin-Lim separately by feeding the spectrogram, to time it on its own:
+    linear = self.session.run(self.model.linear_outputs, feed_dict=feed_dict)
+    decoded = time.time()
+    wav = self.session.run(self.wav_output, feed_dict={self.model.linear_outputs: linear})
     wav = audio.inv_preemphasis(wav)
     wav = wav[:audio.find_endpoint(wav)]
+    inverted = time.time()
     out = io.BytesIO()
     audio.save_wav(wav, out)
+    if timings is not None:
+      timings.update({
+        'tokenize': tokenized - start,
+        'decoder': decoded - tokenized,
+        'griffin_lim': inverted - decoded,
+        'wav_encode': time.time() - inverted,
+        'audio_seconds': len(wav) / hparams.sample_rate
+      })
     return out.getvalue()
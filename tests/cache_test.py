@@ -0,0 +1,36 @@
+from util.cache import LRUCache
+
+
+def test_lru_eviction():
+  cache = LRUCache(2)
+  cache.put('a', 1)
+  cache.put('b', 2)
+  assert cache.get('a') == 1  # 'b' is now least recently used
+  cache.put('c', 3)
+  assert 'b' not in cache
+  assert cache.get('a') == 1
+  assert cache.get('c') == 3
+  cache.put('a', 4)  # Updating also counts as a use
+  cache.put('d', 5)
+  assert 'c' not in cache
+  assert cache.get('a') == 4
+  assert len(cache) == 2
+
+
+def test_hit_ratio():
+  cache = LRUCache(2)
+  assert cache.hit_ratio == 0.0
+  assert cache.get('a') is None
+  cache.put('a', 1)
+  assert cache.get('a') == 1
+  assert cache.get('a') == 1
+  assert cache.get('b') is None
+  assert (cache.hits, cache.lookups) == (2, 4)
+  assert cache.hit_ratio == 0.5
+
+
+def test_disabled():
+  cache = LRUCache(0)
+  cache.put('a', 1)
+  assert len(cache) == 0
+  assert cache.get('a') is None
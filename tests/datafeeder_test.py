@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from datasets.datafeeder import _padding_efficiency, _parse_schedule, _prepare_targets, \
+  _scheduled_outputs_per_step, _split_by_frames
+
+
+def _examples(lengths):
+  # (input, mel_target, linear_target, cost) as returned by DataFeeder._get_next_example
+  return [(np.zeros(5, dtype=np.int32), np.ones((n, 2), dtype=np.float32), None, n)
+    for n in sorted(lengths)]
+
+
+def _check_batches(batches, examples, max_frames, outputs_per_step, frames):
+  assert [x for b in batches for x in b] == examples
+  for batch in batches:
+    if len(batch) > 1:
+      assert frames(batch) <= max_frames
+    else:
+      assert batch[0][-1] > max_frames or frames(batch) <= max_frames
+
+
+def test_split_by_frames_padded():
+  examples = _examples([3, 10, 11, 20, 25, 40, 41, 90, 300])
+  batches = _split_by_frames(examples, 100, 5, 'padded')
+  padded = lambda b: len(b) * _prepare_targets([x[1] for x in b], 5).shape[1]
+  _check_batches(batches, examples, 100, 5, padded)
+  assert batches[-1] == examples[-1:]  # Over the budget on its own
+  assert [len(b) for b in batches] == [4, 2, 1, 1, 1]
+
+
+def test_split_by_frames_total():
+  examples = _examples([3, 10, 11, 20, 25, 40, 41, 90, 300])
+  batches = _split_by_frames(examples, 100, 5, 'total')
+  total = lambda b: sum(x[-1] for x in b)
+  _check_batches(batches, examples, 100, 5, total)
+  assert batches[-1] == examples[-1:]
+  assert [len(b) for b in batches] == [5, 2, 1, 1]
+
+
+def test_padding_efficiency():
+  for lengths, r in [([10, 11, 20], 1), ([10, 11, 20], 5), ([7], 3), ([4, 99], 2)]:
+    batch = _examples(lengths)
+    padded = _prepare_targets([x[1] for x in batch], r)
+    real = sum(x[1].shape[0] for x in batch)
+    assert np.isclose(_padding_efficiency(batch, r), real / (padded.shape[0] * padded.shape[1]))
+
+
+def test_parse_schedule():
+  assert _parse_schedule('', 5) == []
+  assert _parse_schedule('50000:2, 0:5,20000:3', 5) == [(0, 5), (20000, 3), (50000, 2)]
+  with pytest.raises(ValueError):
+    _parse_schedule('0:5,20000:3', 4)
+
+
+def test_scheduled_outputs_per_step():
+  schedule = _parse_schedule('50000:2,0:5,20000:3', 5)
+  assert _scheduled_outputs_per_step(schedule, 0, 1) == 5
+  assert _scheduled_outputs_per_step(schedule, 19999, 1) == 5
+  assert _scheduled_outputs_per_step(schedule, 20000, 1) == 3
+  assert _scheduled_outputs_per_step(schedule, 10 ** 6, 1) == 2
+  assert _scheduled_outputs_per_step(_parse_schedule('1000:2', 5), 10, 5) == 5
@@ -0,0 +1,80 @@
+import pytest
+from util.metrics import Registry
+
+
+def test_counter_and_gauge():
+  registry = Registry()
+  counter = registry.counter('requests_total', 'Requests.', ['route'])
+  gauge = registry.gauge('in_flight', 'In flight.')
+  counter.inc(route='/a')
+  counter.inc(2, route='/a')
+  counter.inc(route='/b')
+  gauge.inc()
+  gauge.inc()
+  gauge.dec()
+  assert registry.expose() == '\n'.join([
+    '# HELP requests_total Requests.',
+    '# TYPE requests_total counter',
+    'requests_total{route="/a"} 3',
+    'requests_total{route="/b"} 1',
+    '# HELP in_flight In flight.',
+    '# TYPE in_flight gauge',
+    'in_flight 1',
+  ]) + '\n'
+
+
+def test_unlabelled_metrics_start_at_zero():
+  registry = Registry()
+  registry.gauge('ready', 'Ready.')
+  registry.counter('total', 'Total.')
+  registry.counter('labelled_total', 'Labelled.', ['route'])
+  lines = registry.expose().splitlines()
+  assert 'ready 0' in lines
+  assert 'total 0' in lines
+  assert not [l for l in lines if l.startswith('labelled_total')]
+
+
+def test_histogram():
+  registry = Registry()
+  histogram = registry.histogram('latency_seconds', 'Latency.', ['stage'], buckets=(0.5, 0.1, 1))
+  histogram.observe(0.05, stage='decoder')
+  histogram.observe(0.5, stage='decoder')
+  histogram.observe(3, stage='decoder')
+  lines = registry.expose().splitlines()
+  assert lines[2:] == [
+    'latency_seconds_bucket{stage="decoder",le="0.1"} 1',
+    'latency_seconds_bucket{stage="decoder",le="0.5"} 2',
+    'latency_seconds_bucket{stage="decoder",le="1"} 2',
+    'latency_seconds_bucket{stage="decoder",le="+Inf"} 3',
+    'latency_seconds_sum{stage="decoder"} 3.55',
+    'latency_seconds_count{stage="decoder"} 3',
+  ]
+
+
+def test_unlabelled_histogram_starts_empty():
+  registry = Registry()
+  registry.histogram('latency_seconds', 'Latency.', buckets=(1,))
+  assert registry.expose().splitlines()[2:] == [
+    'latency_seconds_bucket{le="1"} 0',
+    'latency_seconds_bucket{le="+Inf"} 0',
+    'latency_seconds_sum 0.0',
+    'latency_seconds_count 0',
+  ]
+
+
+def test_label_escaping():
+  registry = Registry()
+  counter = registry.counter('texts_total', 'Texts.', ['text'])
+  counter.inc(text='a "b"\\c\nd')
+  assert registry.expose().splitlines()[-1] == 'texts_total{text="a \\"b\\"\\\\c\\nd"} 1'
+
+
+def test_label_mismatch():
+  registry = Registry()
+  counter = registry.counter('requests_total', 'Requests.', ['route', 'status'])
+  with pytest.raises(ValueError):
+    counter.inc(route='/a')
+  with pytest.raises(ValueError):
+    counter.inc(route='/a', status='200', method='GET')
+  with pytest.raises(ValueError):
+    registry.gauge('ready', 'Ready.').set(1, route='/a')
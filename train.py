@@ -1,7 +1,9 @@
 import argparse
 from datetime import datetime
 import math
+import multiprocessing
 import os
+import queue
 import subprocess
 import time
 import tensorflow as tf
@@ -11,7 +13,7 @@ from datasets.datafeeder import DataFeeder
 from hparams import hparams, hparams_debug_string
 from models import create_model
 from text import sequence_to_text
-from util import audio, infolog, plot, ValueWindow
+from util import audio, infolog, plot, profile, ValueWindow
 log = infolog.log
 
 
@@ -42,6 +44,64 @@ def time_string():
   return datetime.now().strftime('%Y-%m-%d %H:%M')
 
 
+def write_samples(sample_queue):
+  '''Runs Griffin-Lim, writes the wav and plots the alignment for each queued checkpoint.'''
+  while True:
+    item = sample_queue.get()
+    if item is None:
+      return
+    spectrogram, alignment, wav_path, plot_path, info = item
+    try:
+      waveform = audio.inv_spectrogram(spectrogram.T)
+      audio.save_wav(waveform, wav_path)
+      plot.plot_alignment(alignment, plot_path, info=info)
+    except Exception:
+      traceback.print_exc()
+
+
+def start_sample_writer():
+  '''Starts write_samples in a forked process. Must be called before creating the session.'''
+  infolog.flush()
+  context = multiprocessing.get_context('fork')
+  sample_queue = context.Queue(maxsize=2)
+  process = context.Process(target=write_samples, args=(sample_queue,), daemon=True)
+  process.start()
+  return sample_queue, process
+
+
+def session_config(args):
+  return tf.ConfigProto(intra_op_parallelism_threads=args.intra_op_threads,
+    inter_op_parallelism_threads=args.inter_op_threads)
+
+
+def cluster_spec(args):
+  return tf.train.ClusterSpec({
+    'ps': args.ps_hosts.split(','),
+    'worker': args.worker_hosts.split(',')
+  })
+
+
+def create_session(target, is_chief, model, saver, restore_path, config):
+  '''Creates the training session. The chief initializes variables or restores them from
+  restore_path; in distributed training the other workers wait until it is done.'''
+  local_init_op = tf.local_variables_initializer()
+  ready_for_local_init_op = None
+  if model.sync_optimizer is not None:
+    with tf.control_dependencies([local_init_op]):
+      local_init_op = tf.group(model.sync_optimizer.chief_init_op if is_chief
+        else model.sync_optimizer.local_step_init_op)
+    ready_for_local_init_op = model.sync_optimizer.ready_for_local_init_op
+  manager = tf.train.SessionManager(local_init_op=local_init_op,
+    ready_for_local_init_op=ready_for_local_init_op)
+  if is_chief:
+    sess = manager.prepare_session(target, init_op=tf.global_variables_initializer(),
+      saver=saver, checkpoint_filename_with_path=restore_path, config=config)
+    if model.sync_optimizer is not None:
+      sess.run(model.sync_optimizer.get_init_tokens_op())
+    return sess
+  return manager.wait_for_session(target, config=config)
+
+
 def train(log_dir, args):
   commit = get_git_commit() if args.git else 'None'
   checkpoint_path = os.path.join(log_dir, 'model.ckpt')
@@ -51,75 +111,134 @@ def train(log_dir, args):
   log('Using model: %s' % args.model)
   log(hparams_debug_string())
 
-  # Set up DataFeeder:
-  coord = tf.train.Coordinator()
-  with tf.variable_scope('datafeeder') as scope:
-    feeder = DataFeeder(coord, input_path, hparams)
+  # Only the chief (worker 0) writes summaries, checkpoints and samples. Start the sample writer
+  # before TensorFlow starts any threads:
+  is_chief = args.task_index == 0
+  if is_chief:
+    sample_queue, sample_process = start_sample_writer()
+
+  # Set up distributed training:
+  config = session_config(args)
+  if args.worker_hosts:
+    cluster = cluster_spec(args)
+    server = tf.train.Server(cluster, job_name='worker', task_index=args.task_index, config=config)
+    target = server.target
+    num_workers = cluster.num_tasks('worker')
+    worker_device = '/job:worker/task:%d' % args.task_index
+    device = tf.train.replica_device_setter(worker_device=worker_device, cluster=cluster)
+    log('Worker %d of %d' % (args.task_index, num_workers))
+  else:
+    target = ''
+    num_workers = 1
+    worker_device = None
+    device = None
+
+  with tf.device(device):
+    global_step = tf.Variable(0, name='global_step', trainable=False)
 
-  # Set up model:
-  global_step = tf.Variable(0, name='global_step', trainable=False)
-  with tf.variable_scope('model') as scope:
-    model = create_model(args.model, hparams)
-    model.initialize(feeder.inputs, feeder.input_lengths, feeder.mel_targets, feeder.linear_targets)
-    model.add_loss()
-    model.add_optimizer(global_step)
-    stats = add_stats(model)
+    # Set up DataFeeder:
+    coord = tf.train.Coordinator()
+    with tf.variable_scope('datafeeder') as scope:
+      feeder = DataFeeder(coord, input_path, hparams, args.task_index, num_workers, global_step)
+
+    # Set up model:
+    with tf.variable_scope('model') as scope:
+      model = create_model(args.model, hparams)
+      model.initialize(feeder.inputs, feeder.input_lengths, feeder.mel_targets, feeder.linear_targets,
+        feeder.outputs_per_step)
+      model.add_loss()
+      model.add_optimizer(global_step, num_workers, worker_device)
+      stats = add_stats(model)
 
   # Bookkeeping:
   step = 0
   time_window = ValueWindow(100)
   loss_window = ValueWindow(100)
   saver = tf.train.Saver(max_to_keep=5, keep_checkpoint_every_n_hours=2)
+  profile_steps = set(int(x) for x in args.profile_steps.split(',') if x.strip())
+  run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+  restore_path = '%s-%d' % (checkpoint_path, args.restore_step) if args.restore_step else None
 
   # Train!
-  with tf.Session() as sess:
+  with create_session(target, is_chief, model, saver, restore_path, config) as sess:
     try:
-      summary_writer = tf.summary.FileWriter(log_dir, sess.graph)
-      sess.run(tf.global_variables_initializer())
-
-      if args.restore_step:
-        # Restore from a checkpoint if the user requested it.
-        restore_path = '%s-%d' % (checkpoint_path, args.restore_step)
-        saver.restore(sess, restore_path)
-        log('Resuming from checkpoint: %s at commit: %s' % (restore_path, commit), slack=True)
-      else:
-        log('Starting new training run at commit: %s' % commit, slack=True)
+      if is_chief:
+        summary_writer = tf.summary.FileWriter(log_dir, sess.graph)
+        if restore_path:
+          log('Resuming from checkpoint: %s at commit: %s' % (restore_path, commit), slack=True)
+        else:
+          log('Starting new training run at commit: %s' % commit, slack=True)
+        if model.sync_optimizer is not None:
+          model.sync_optimizer.get_chief_queue_runner().create_threads(
+            sess, coord=coord, daemon=True, start=True)
 
       feeder.start_in_session(sess)
+      step = sess.run(global_step)
 
       while not coord.should_stop():
         start_time = time.time()
-        step, loss, opt = sess.run([global_step, model.loss, model.optimize])
+        # With gradient accumulation, all but the last batch of a step only accumulate:
+        losses = [sess.run([model.loss, model.accumulate])[0]
+          for i in range(hparams.accumulate_steps - 1)]
+        fetches = [global_step, model.loss, model.optimize, feeder.padding_efficiency]
+        if step + 1 in profile_steps:
+          run_metadata = tf.RunMetadata()
+          queue_size = sess.run(feeder.queue_size)
+          step, loss, opt, efficiency = sess.run(fetches, options=run_options,
+            run_metadata=run_metadata)
+          trace_path = os.path.join(log_dir, 'timeline-step-%d.json' % step)
+          profile.write_chrome_trace(run_metadata, trace_path)
+          log('Profiled step %d (queue size %d, trace: %s): %s' % (
+            step, queue_size, trace_path, profile.format_times(profile.scope_times(run_metadata))))
+        else:
+          step, loss, opt, efficiency = sess.run(fetches)
+        loss = sum(losses + [loss]) / hparams.accumulate_steps
         time_window.append(time.time() - start_time)
         loss_window.append(loss)
-        message = 'Step %-7d [%.03f sec/step, loss=%.05f, avg_loss=%.05f]' % (
-          step, time_window.average, loss, loss_window.average)
-        log(message, slack=(step % args.checkpoint_interval == 0))
+        message = 'Step %-7d [%.03f sec/step, loss=%.05f, avg_loss=%.05f, pad_eff=%.1f%%]' % (
+          step, time_window.average, loss, loss_window.average, 100 * efficiency)
+        log(message, slack=(is_chief and step % args.checkpoint_interval == 0))
 
         if loss > 100 or math.isnan(loss):
           log('Loss exploded to %.05f at step %d!' % (loss, step), slack=True)
           raise Exception('Loss Exploded')
 
+        if args.max_steps and step >= args.max_steps:
+          log('Reached max_steps: %d' % args.max_steps)
+          coord.request_stop()
+
+        if not is_chief:
+          continue
+
         if step % args.summary_interval == 0:
           log('Writing summary at step: %d' % step)
           summary_writer.add_summary(sess.run(stats), step)
 
         if step % args.checkpoint_interval == 0:
+          checkpoint_start = time.time()
           log('Saving checkpoint to: %s-%d' % (checkpoint_path, step))
           saver.save(sess, checkpoint_path, global_step=step)
           log('Saving audio and alignment...')
           input_seq, spectrogram, alignment = sess.run([
             model.inputs[0], model.linear_outputs[0], model.alignments[0]])
-          waveform = audio.inv_spectrogram(spectrogram.T)
-          audio.save_wav(waveform, os.path.join(log_dir, 'step-%d-audio.wav' % step))
-          plot.plot_alignment(alignment, os.path.join(log_dir, 'step-%d-align.png' % step),
-            info='%s, %s, %s, step=%d, loss=%.5f' % (args.model, commit, time_string(), step, loss))
+          try:
+            sample_queue.put_nowait((spectrogram, alignment,
+              os.path.join(log_dir, 'step-%d-audio.wav' % step),
+              os.path.join(log_dir, 'step-%d-align.png' % step),
+              '%s, %s, %s, step=%d, loss=%.5f' % (args.model, commit, time_string(), step, loss)))
+          except queue.Full:
+            log('Sample writer is behind, skipping audio and alignment for step %d' % step)
           log('Input: %s' % sequence_to_text(input_seq,lang='zh'))
+          log('Checkpoint blocked training for %.03f sec' % (time.time() - checkpoint_start))
 
     except Exception as e:
       log('Exiting due to exception: %s' % e, slack=True)
       traceback.print_exc()
       coord.request_stop(e)
+    finally:
+      if is_chief:
+        sample_queue.put(None)
+        sample_process.join()
 
 
 def main():
@@ -135,15 +254,36 @@ def main():
     help='Steps between running summary ops.')
   parser.add_argument('--checkpoint_interval', type=int, default=1000,
     help='Steps between writing checkpoints.')
+  parser.add_argument('--profile_steps', default='',
+    help='Comma-separated list of steps to trace. Writes Chrome traces to the log directory.')
+  parser.add_argument('--max_steps', type=int, help='Stop training after this global step.')
+  parser.add_argument('--intra_op_threads', type=int, default=0,
+    help='Threads per op (0: number of cores). Lower it when running several workers per machine.')
+  parser.add_argument('--inter_op_threads', type=int, default=0,
+    help='Threads for running independent ops in parallel (0: number of cores).')
+  parser.add_argument('--ps_hosts', default='',
+    help='Comma-separated host:port list of parameter servers, for distributed training.')
+  parser.add_argument('--worker_hosts', default='',
+    help='Comma-separated host:port list of workers. If set, trains synchronously on all workers.')
+  parser.add_argument('--job_name', default='worker', choices=['ps', 'worker'],
+    help='Role of this process in distributed training.')
+  parser.add_argument('--task_index', type=int, default=0,
+    help='Index of this process within its job. Worker 0 is the chief.')
   parser.add_argument('--slack_url', help='Slack webhook URL to get periodic reports.')
   parser.add_argument('--tf_log_level', type=int, default=1, help='Tensorflow C++ log level.')
   parser.add_argument('--git', action='store_true', help='If set, verify that the client is clean.')
   args = parser.parse_args()
   os.environ['TF_CPP_MIN_LOG_LEVEL'] = str(args.tf_log_level)
+  if args.job_name == 'ps':
+    server = tf.train.Server(cluster_spec(args), job_name='ps', task_index=args.task_index,
+      config=session_config(args))
+    server.join()
+    return
   run_name = args.name or args.model
   log_dir = os.path.join(args.base_dir, 'logs-%s' % run_name)
   os.makedirs(log_dir, exist_ok=True)
-  infolog.init(os.path.join(log_dir, 'train.log'), run_name, args.slack_url)
+  log_name = 'train.log' if args.task_index == 0 else 'train-worker%d.log' % args.task_index
+  infolog.init(os.path.join(log_dir, log_name), run_name, args.slack_url)
   hparams.parse(args.hparams)
   train(log_dir, args)
 
@@ -0,0 +1,45 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache():
+  '''Thread-safe least-recently-used cache that keeps hit statistics.
+
+  Args:
+    max_entries: number of entries kept; 0 disables the cache
+  '''
+  def __init__(self, max_entries):
+    self.max_entries = max_entries
+    self.hits = 0
+    self.lookups = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    '''Returns the value for key, or None if it is not cached.'''
+    with self._lock:
+      self.lookups += 1
+      value = self._entries.get(key)
+      if value is not None:
+        self.hits += 1
+        self._entries.move_to_end(key)
+      return value
+
+  def put(self, key, value):
+    if self.max_entries <= 0:
+      return
+    with self._lock:
+      self._entries[key] = value
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  @property
+  def hit_ratio(self):
+    return self.hits / self.lookups if self.lookups else 0.0
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __contains__(self, key):
+    return key in self._entries
@@ -30,6 +30,11 @@ def log(msg, slack=False):
     Thread(target=_send_slack, args=(msg,)).start()
 
 
+def flush():
+  if _file is not None:
+    _file.flush()
+
+
 def _close_logfile():
   global _file
   if _file is not None:
@@ -0,0 +1,128 @@
+import math
+import threading
+
+
+class _Metric():
+  '''Base class for metrics, with one value per combination of label values.'''
+  kind = None
+
+  def __init__(self, name, documentation, labelnames=()):
+    self.name = name
+    self.documentation = documentation
+    self._labelnames = tuple(labelnames)
+    self._values = {}
+    self._lock = threading.Lock()
+    # Export unlabelled metrics from the start (e.g. a gauge reading 0) rather than once set:
+    if not self._labelnames:
+      self._values[()] = self._zero()
+
+  def _zero(self):
+    return 0
+
+  def _key(self, labels):
+    if set(labels) != set(self._labelnames):
+      raise ValueError('%s expects labels %s, got %s' % (self.name, self._labelnames, sorted(labels)))
+    return tuple(str(labels[name]) for name in self._labelnames)
+
+  def _format_labels(self, key, extra=()):
+    pairs = list(zip(self._labelnames, key)) + list(extra)
+    if not pairs:
+      return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, _escape(v)) for k, v in pairs)
+
+  def _samples(self, key, value):
+    yield self.name + self._format_labels(key), value
+
+  def expose(self):
+    lines = ['# HELP %s %s' % (self.name, self.documentation), '# TYPE %s %s' % (self.name, self.kind)]
+    with self._lock:
+      items = sorted(self._values.items())
+    for key, value in items:
+      for name, sample in self._samples(key, value):
+        lines.append('%s %s' % (name, _format_value(sample)))
+    return '\n'.join(lines)
+
+
+class Counter(_Metric):
+  kind = 'counter'
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+  kind = 'gauge'
+
+  def set(self, value, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = value
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def dec(self, amount=1, **labels):
+    self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+  kind = 'histogram'
+  default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+  def __init__(self, name, documentation, labelnames=(), buckets=default_buckets):
+    self._buckets = tuple(sorted(buckets)) + (math.inf,)
+    super(Histogram, self).__init__(name, documentation, labelnames)
+
+  def _zero(self):
+    return ([0] * len(self._buckets), 0.0)
+
+  def observe(self, value, **labels):
+    key = self._key(labels)
+    with self._lock:
+      counts, total = self._values.get(key, self._zero())
+      counts = [c + (value <= bound) for c, bound in zip(counts, self._buckets)]
+      self._values[key] = (counts, total + value)
+
+  def _samples(self, key, value):
+    counts, total = value
+    for bound, count in zip(self._buckets, counts):
+      le = '+Inf' if bound == math.inf else _format_value(bound)
+      yield self.name + '_bucket' + self._format_labels(key, [('le', le)]), count
+    yield self.name + '_sum' + self._format_labels(key), total
+    yield self.name + '_count' + self._format_labels(key), counts[-1]
+
+
+class Registry():
+  '''Collects metrics and renders them in the Prometheus text exposition format.'''
+  def __init__(self):
+    self._metrics = []
+
+  def register(self, metric):
+    self._metrics.append(metric)
+    return metric
+
+  def counter(self, name, documentation, labelnames=()):
+    return self.register(Counter(name, documentation, labelnames))
+
+  def gauge(self, name, documentation, labelnames=()):
+    return self.register(Gauge(name, documentation, labelnames))
+
+  def histogram(self, name, documentation, labelnames=(), buckets=Histogram.default_buckets):
+    return self.register(Histogram(name, documentation, labelnames, buckets))
+
+  def expose(self):
+    return '\n'.join(m.expose() for m in self._metrics) + '\n'
+
+
+def _escape(label_value):
+  return label_value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+  if isinstance(value, float):
+    return repr(value) if math.isfinite(value) else ('+Inf' if value > 0 else '-Inf')
+  return str(value)
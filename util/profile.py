@@ -0,0 +1,52 @@
+from collections import OrderedDict
+from tensorflow.python.client import timeline
+
+
+# Op name prefixes for the step-time summary, checked in order:
+_scopes = [
+  ('dequeue', 'datafeeder/'),
+  ('encoder_cbhg', 'model/inference/encoder_cbhg/'),
+  ('decoder', 'model/inference/decoder/'),
+  ('post_cbhg', 'model/inference/post_cbhg/'),
+  ('inference_other', 'model/inference/'),
+  ('loss', 'model/loss/'),
+  ('gradients', 'model/optimizer/gradients/'),
+  ('optimizer', 'model/optimizer/'),
+]
+
+
+def scope_times(run_metadata):
+  '''Returns the op time in msec per scope from the step stats of a traced run.
+
+  Times are summed over ops, so with inter-op parallelism they can add up to more than the
+  step's wall time (which is returned as "wall").
+  '''
+  times = OrderedDict((name, 0.0) for name, _ in _scopes)
+  times['other'] = 0.0
+  start, end = None, None
+  for device in run_metadata.step_stats.dev_stats:
+    for node in device.node_stats:
+      times[_scope_name(node.node_name)] += node.all_end_rel_micros / 1000.0
+      node_end = node.all_start_micros + node.all_end_rel_micros
+      start = node.all_start_micros if start is None else min(start, node.all_start_micros)
+      end = node_end if end is None else max(end, node_end)
+  times['wall'] = 0.0 if start is None else (end - start) / 1000.0
+  return times
+
+
+def format_times(times):
+  return ', '.join('%s=%.1fms' % (name, ms) for name, ms in times.items())
+
+
+def write_chrome_trace(run_metadata, path):
+  '''Writes the step stats as Chrome trace JSON (open in chrome://tracing)'''
+  trace = timeline.Timeline(run_metadata.step_stats)
+  with open(path, 'w') as f:
+    f.write(trace.generate_chrome_trace_format())
+
+
+def _scope_name(node_name):
+  for name, prefix in _scopes:
+    if node_name.startswith(prefix):
+      return name
+  return 'other'